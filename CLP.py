@@ -1,132 +1,380 @@
+import math
+import random
 import socket
+import selectors
 import threading
 import time
-from opcua import Client
+import numpy as np
+from sessao_opc import SessaoOPC, vincular_drones
+from agendador import FixedRateScheduler
+from protocolo_clp import (TERMINADOR, TAM_MAX_LINHA, SAUDACAO, VERSAO_BINARIA, QUADRO,
+                           TAM_QUADRO, STATUS_OK, STATUS_FORMATO, STATUS_DRONE, MENSAGENS_STATUS,
+                           TELEMETRIA_GRUPO, TELEMETRIA_PORTA, eh_multicast, empacotar_telemetria)
 
+# poses da frota: linha i = drone i+1 (um só drone fora do modo frota)
 lock_data = threading.Lock()
-pos_drone = {"x": 0.0, "y": 0.0, "z": 0.0}
-pos_target = {"x": 0.0, "y": 0.0, "z": 0.0} 
+target_alterado = threading.Event()
+pos_drone = np.zeros((1, 3))
+pos_target = np.zeros((1, 3))
 
 OPCUA_URL = "opc.tcp://localhost:53530/OPCUA/SimulationServer" 
+OPC_MODO = "subscription"  # "subscription" ou "polling"
+OPC_PUBLISH_MS = 50        # intervalo de publicação da subscription (ms)
+OPC_PERIODO = 0.5          # período do polling / reescrita do target (s)
+FROTA = False              # True: pastas Drone1..DroneN no servidor OPC UA
+OPC_LOG_PERIODO = 5.0      # intervalo mínimo entre as linhas "[OPC] Lendo ..." (s)
 TCP_HOST = "localhost"
 TCP_PORT = 65432
+TCP_TIMEOUT_OCIOSO = 60.0   # fecha conexões sem tráfego ou com respostas paradas (s)
+TCP_SAIDA_MAX = 1024 * 1024 # respostas não lidas por conexão antes de fechá-la (bytes)
+TCP_ESPERA_LEGADO = 0.02    # espera por '\n' antes de tratar como cliente antigo (s)
 
-def connect_opc(url=OPCUA_URL):
-    client = Client(url)
-    client.connect()
-    print("[OPC] Connected")
+# telemetria UDP: pos_drone e pos_target publicados a cada TELEMETRIA_PERIODO
+# para um grupo multicast (ou endereço de broadcast, ex.: "255.255.255.255")
+TELEMETRIA = True
+TELEMETRIA_PERIODO = 0.05   # 20 Hz
+TELEMETRIA_DESTINO = TELEMETRIA_GRUPO
+TELEMETRIA_PORTA_DESTINO = TELEMETRIA_PORTA
+TELEMETRIA_TTL = 1          # saltos de roteador do multicast (1 = rede local)
 
-    root = client.get_objects_node()
+def ajustar_frota(n):
+    """Redimensiona as poses para n drones, mantendo as que já existiam."""
+    global pos_drone, pos_target
+    with lock_data:
+        if len(pos_drone) == n:
+            return
+        m = min(n, len(pos_drone))
+        novo_drone, novo_target = np.zeros((n, 3)), np.zeros((n, 3))
+        novo_drone[:m], novo_target[:m] = pos_drone[:m], pos_target[:m]
+        pos_drone, pos_target = novo_drone, novo_target
 
-    drone_folder = None
-    try:
-        drone_folder = root.get_child(["3:Drone"])
-    except Exception:
-    
-        for n in root.get_children():
-            try:
-                name = n.get_browse_name().Name
-                if name.lower() == "drone": 
-                    drone_folder = n
-                    break
-            except Exception:
-                pass
-    if drone_folder is None:
-        raise RuntimeError("Não encontrei a pasta 'Drone' no servidor OPC UA.") 
-
-    name_to_node = {}
-    for v in drone_folder.get_children():
-        try:
-            nm = v.get_browse_name().Name
-            name_to_node[nm.lower()] = v
-        except Exception:
-            pass
 
-    tX = name_to_node.get("targetx")
-    tY = name_to_node.get("targety")
-    tZ = name_to_node.get("targetz")
-    dX = name_to_node.get("dronex")
-    dY = name_to_node.get("droney")
-    dZ = name_to_node.get("dronez")
+class HandlerDrone:
+    """Recebe as notificações de mudança de DroneX/Y/Z e atualiza pos_drone."""
+
+    def __init__(self, indices_por_nodeid):
+        self.indices = indices_por_nodeid
+
+    def datachange_notification(self, node, val, data):
+        indice = self.indices.get(node.nodeid)
+        if indice is None:
+            return
+        with lock_data:
+            pos_drone[indice] = val
+
+    def status_change_notification(self, status):
+        print(f"[OPC] Status da subscription: {status}")
 
-    if not all([tX, tY, tZ, dX, dY, dZ]):
-        found = ", ".join(sorted(name_to_node.keys()))
-        raise RuntimeError(
-            "Variáveis esperadas não encontradas. "
-            "Quero TargetX, TargetY, TargetZ, DroneX, DroneY, DroneZ. "
-            f"Encontradas: {found}"
-        )
 
-    print("[OPC] Vars bound:",
-            "TargetX/TargetY/TargetZ & DroneX/DroneY/DroneZ")
-    return client, (tX, tY, tZ, dX, dY, dZ)
+def assinar_drone(client, nos_drone):
+    # nos_drone = [x1, y1, z1, x2, ...] -> (drone, eixo)
+    handler = HandlerDrone({no.nodeid: divmod(k, 3) for k, no in enumerate(nos_drone)})
+    sub = client.create_subscription(OPC_PUBLISH_MS, handler)
+    sub.subscribe_data_change(nos_drone)
+    print(f"[OPC] Subscription ativa em DroneX/DroneY/DroneZ de {len(nos_drone) // 3} drone(s) "
+          f"({OPC_PUBLISH_MS} ms)")
+    return sub
 
 
 def thread_opcua_client():
-    
+
+    sessao = SessaoOPC(OPCUA_URL, tag="OPC", ligar=lambda c: vincular_drones(c, OPCUA_URL, FROTA))
     while True:
+        client, (pastas, nos_target, nos_drone) = sessao.conectar()
         try:
-            client, (node_tx, node_ty, node_tz, node_dx, node_dy, node_dz) = connect_opc(OPCUA_URL)
+            ajustar_frota(len(pastas))
+            if FROTA:
+                print(f"[OPC] Frota: {', '.join(pastas)}")
 
+            sub = None
+            if OPC_MODO == "subscription":
+                try:
+                    sub = assinar_drone(client, nos_drone)
+                except Exception as e:
+                    print(f"[OPC] Subscription indisponível ({e}). Usando polling.")
+
+            proximo_log = 0.0
             while True:
-                with lock_data:
-                    pos_drone["x"] = node_dx.get_value()
-                    pos_drone["y"] = node_dy.get_value()
-                    pos_drone["z"] = node_dz.get_value()
+                # a frota inteira num único Read e num único Write
+                if sub is None:
+                    valores = client.get_values(nos_drone)
+                    with lock_data:
+                        pos_drone[:] = np.reshape(valores, (-1, 3))
                 
                 with lock_data:
                     local_target = pos_target.copy()
                 
-                node_tx.set_value(local_target["x"])
-                node_ty.set_value(local_target["y"])
-                node_tz.set_value(local_target["z"])
+                client.set_values(nos_target, local_target.ravel().tolist())
                 
-                print(f"[OPC] Lendo: {pos_drone} | Escrevendo: {local_target}")
-                time.sleep(0.5)
+                if time.monotonic() >= proximo_log:
+                    proximo_log = time.monotonic() + OPC_LOG_PERIODO
+                    print(f"[OPC] Lendo: {pos_drone.tolist()} | Escrevendo: {local_target.tolist()}")
+                if sub is None:
+                    time.sleep(OPC_PERIODO)
+                else:
+                    # a posição chega pela subscription; aqui só se reescreve
+                    # o target quando ele muda (ou a cada OPC_PERIODO)
+                    target_alterado.wait(OPC_PERIODO)
+                    target_alterado.clear()
+                if sessao.caiu.is_set():
+                    raise ConnectionError("keep-alive sem resposta")
 
         except Exception as e:
-            print(f"[OPC] Erro: {e}. Tentando reconectar em 5s...")
-            client.disconnect()
-            time.sleep(5)
+            sessao.falhou(e)
+
+def processar_comando(texto):
+    """Aplica um target "x,y,z" (drone 1) ou "n:x,y,z" (drone n) e devolve a
+    posição atual desse drone como texto; erros voltam com as mesmas
+    mensagens dos status do protocolo binário."""
+    drone, sep, coords = texto.rpartition(':')
+    try:
+        i = int(drone) - 1 if sep else 0
+        x, y, z = map(float, coords.split(','))
+    except ValueError:
+        return MENSAGENS_STATUS[STATUS_FORMATO]
+    if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(z)):
+        return MENSAGENS_STATUS[STATUS_FORMATO]
+
+    with lock_data:
+        if not 0 <= i < len(pos_target):
+            return MENSAGENS_STATUS[STATUS_DRONE]
+        # só acorda a escrita OPC UA se o target mudou de fato
+        if pos_target[i].tolist() != [x, y, z]:
+            pos_target[i] = (x, y, z)
+            target_alterado.set()
+        return ",".join(map(str, pos_drone[i].tolist()))
+
+def thread_telemetria():
+    """Publica instantâneos das poses por UDP, com número de sequência."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    if eh_multicast(TELEMETRIA_DESTINO):
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, TELEMETRIA_TTL)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    else:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    destino = (TELEMETRIA_DESTINO, TELEMETRIA_PORTA_DESTINO)
+    print(f"[UDP] Publicando telemetria em {destino[0]}:{destino[1]} "
+          f"a cada {1e3 * TELEMETRIA_PERIODO:.0f} ms")
+
+    sched = FixedRateScheduler(TELEMETRIA_PERIODO)
+    # sessão nova a cada início: os receptores recomeçam a contagem do seq
+    sessao, seq, ultimo_erro = random.getrandbits(32), 0, None
+    while True:
+        sched.wait()
+        with lock_data:
+            datagrama = empacotar_telemetria(sessao, seq, time.time(), pos_drone, pos_target)
+        try:
+            sock.sendto(datagrama, destino)
+            ultimo_erro = None
+        except OSError as e:
+            # avisa uma vez por tipo de falha, não a cada período
+            if str(e) != ultimo_erro:
+                print(f"[UDP] Falha ao publicar telemetria: {e}")
+                ultimo_erro = str(e)
+        seq = (seq + 1) & 0xFFFFFFFF
+
+def processar_quadro(seq, drone, x, y, z):
+    """Pedido binário: aplica o target do drone e devolve o quadro de resposta
+    com a posição dele, o instante da leitura e o status."""
+    i = drone - 1
+    with lock_data:
+        if not 0 <= i < len(pos_target):
+            status, pos = STATUS_DRONE, (math.nan, math.nan, math.nan)
+        elif not (math.isfinite(x) and math.isfinite(y) and math.isfinite(z)):
+            status, pos = STATUS_FORMATO, pos_drone[i].tolist()
+        else:
+            if pos_target[i].tolist() != [x, y, z]:
+                pos_target[i] = (x, y, z)
+                target_alterado.set()
+            status, pos = STATUS_OK, pos_drone[i].tolist()
+    if status != STATUS_OK:
+        print(f"[TCP] Pedido binário {seq} inválido (drone {drone}, status {status}).")
+    return QUADRO.pack(seq, drone, status, time.time(), *pos)
+
+
+class ConexaoTCP:
+    """Estado de uma conexão de cliente no servidor não bloqueante."""
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.entrada = bytearray()
+        self.saida = bytearray()
+        self.enquadrado = False     # já mandou alguma linha terminada em '\n'
+        self.binario = False        # negociou o protocolo binário
+        self.fechar_apos_envio = False
+        self.pendente_desde = None  # início de um pedido ainda sem terminador
+        self.saida_desde = None     # última vez que a saída pendente andou
+        self.ultima_atividade = time.monotonic()
+
+
+def responder(conn, texto, terminador):
+    print(f"[TCP] Recebido de {conn.addr}: {texto}")
+    resposta = processar_comando(texto)
+    if resposta == MENSAGENS_STATUS[STATUS_FORMATO]:
+        print("[TCP] Formato de target inválido. Esperado 'x,y,z'.")
+    elif resposta == MENSAGENS_STATUS[STATUS_DRONE]:
+        print(f"[TCP] Drone inexistente em '{texto}'.")
+    conn.saida += resposta.encode('utf-8') + terminador
+
+
+def processar_entrada(conn, agora):
+    # Protocolo binário: quadros de tamanho fixo, respondidos em ordem
+    if conn.binario:
+        n = len(conn.entrada) // TAM_QUADRO * TAM_QUADRO
+        for seq, drone, _, _, x, y, z in QUADRO.iter_unpack(bytes(conn.entrada[:n])):
+            conn.saida += processar_quadro(seq, drone, x, y, z)
+        del conn.entrada[:n]
+        return
+
+    # Saudação do protocolo binário (0xFF nunca inicia uma linha de texto)
+    if not conn.enquadrado and conn.entrada[:1] == SAUDACAO[:1]:
+        if len(conn.entrada) <= len(SAUDACAO):
+            return  # saudação ainda incompleta
+        if conn.entrada[:len(SAUDACAO)] == SAUDACAO:
+            del conn.entrada[:len(SAUDACAO) + 1]
+            conn.binario = True
+            conn.pendente_desde = None
+            conn.saida += SAUDACAO + bytes([VERSAO_BINARIA])
+            print(f"[TCP] Cliente {conn.addr} usando o protocolo binário.")
+            processar_entrada(conn, agora)
+            return
+
+    # Pedidos enquadrados: uma linha por comando, a conexão continua aberta
+    while True:
+        i = conn.entrada.find(TERMINADOR)
+        if i < 0:
+            break
+        linha = bytes(conn.entrada[:i]).decode('utf-8', errors='replace').strip()
+        del conn.entrada[:i + 1]
+        conn.enquadrado = True
+        if linha:
+            responder(conn, linha, TERMINADOR)
+
+    if not conn.entrada:
+        conn.pendente_desde = None
+        return
+
+    if len(conn.entrada) > TAM_MAX_LINHA:
+        print(f"[TCP] Cliente {conn.addr} excedeu o tamanho de linha. Fechando.")
+        conn.entrada.clear()
+        conn.saida += MENSAGENS_STATUS[STATUS_FORMATO].encode('utf-8') + TERMINADOR
+        conn.fechar_apos_envio = True
+        return
+
+    if conn.enquadrado:
+        return  # resto de uma linha que ainda não chegou inteira
+
+    # Cliente antigo: "x,y,z" sem terminador, uma transação por conexão.
+    # Espera um instante para não confundir com uma linha que chegou partida.
+    if conn.pendente_desde is None:
+        conn.pendente_desde = agora
+    if agora - conn.pendente_desde >= TCP_ESPERA_LEGADO:
+        texto = bytes(conn.entrada).decode('utf-8', errors='replace').strip()
+        conn.entrada.clear()
+        conn.pendente_desde = None
+        responder(conn, texto, b"")
+        conn.fechar_apos_envio = True
+
 
 def thread_servidor_tcp():
     
     print(f"[TCP] Iniciando servidor TCP em {TCP_HOST}:{TCP_PORT}...")
-    
+
+    sel = selectors.DefaultSelector()
+    conexoes = {}
+
+    def fechar(conn):
+        try:
+            sel.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+        conexoes.pop(conn.sock, None)
+        print(f"[TCP] Cliente {conn.addr} desconectado.")
+
+    def atualizar_eventos(conn):
+        eventos = selectors.EVENT_READ
+        if conn.saida:
+            eventos |= selectors.EVENT_WRITE
+        sel.modify(conn.sock, eventos, data=conn)
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         s.bind((TCP_HOST, TCP_PORT))
         s.listen()
-        
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ, data=None)
+
         while True:
-            conn, addr = s.accept()
-            with conn:
-                print(f"[TCP] Cliente {addr} conectado.")
-                
-                data = conn.recv(1024)
-                if not data:
+            # com pedido antigo pendente, acorda logo para respondê-lo
+            pendentes = any(c.pendente_desde is not None for c in conexoes.values())
+            eventos = sel.select(timeout=TCP_ESPERA_LEGADO if pendentes else 1.0)
+            agora = time.monotonic()
+
+            for key, mask in eventos:
+                if key.data is None:
+                    try:
+                        sock, addr = s.accept()
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    sock.setblocking(False)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    conn = ConexaoTCP(sock, addr)
+                    conexoes[sock] = conn
+                    sel.register(sock, selectors.EVENT_READ, data=conn)
+                    print(f"[TCP] Cliente {addr} conectado.")
                     continue
-                    
-                new_target_str = data.decode('utf-8')
-                print(f"[TCP] Recebido do Cliente TCP/IP: {new_target_str}")
-                
+
+                conn = key.data
                 try:
-                    x, y, z = map(float, new_target_str.split(','))
-                    
-                    with lock_data:
-                        pos_target["x"] = x
-                        pos_target["y"] = y
-                        pos_target["z"] = z
-                    
-                    with lock_data:
-                        pos_drone_str = f'{pos_drone["x"]},{pos_drone["y"]},{pos_drone["z"]}'
-                    
-                    conn.sendall(pos_drone_str.encode('utf-8'))
+                    if mask & selectors.EVENT_READ:
+                        data = conn.sock.recv(4096)
+                        if not data:
+                            fechar(conn)
+                            continue
+                        conn.entrada += data
+                        conn.ultima_atividade = agora
+                        processar_entrada(conn, agora)
+                        if len(conn.saida) > TCP_SAIDA_MAX:
+                            # cliente que pede e não lê as respostas
+                            print(f"[TCP] Cliente {conn.addr} com {len(conn.saida)} bytes de "
+                                  f"respostas não lidas. Fechando.")
+                            fechar(conn)
+                            continue
 
-                except ValueError:
-                    print("[TCP] Formato de target inválido. Esperado 'x,y,z'.")
-                    conn.sendall(b"Erro: Formato invalido.")
-                except Exception as e:
+                    if mask & selectors.EVENT_WRITE and conn.saida:
+                        enviados = conn.sock.send(conn.saida)
+                        del conn.saida[:enviados]
+                        conn.ultima_atividade = agora
+                        conn.saida_desde = agora if conn.saida else None
+                except (BlockingIOError, InterruptedError):
+                    pass
+                except OSError as e:
                     print(f"[TCP] Erro na conexão: {e}")
+                    fechar(conn)
+                    continue
+
+                if conn.fechar_apos_envio and not conn.saida:
+                    fechar(conn)
+                else:
+                    atualizar_eventos(conn)
+
+            # pedidos antigos que esperaram o suficiente e conexões ociosas
+            for conn in list(conexoes.values()):
+                if conn.pendente_desde is not None:
+                    processar_entrada(conn, agora)
+                    atualizar_eventos(conn)
+                elif conn.saida:
+                    if conn.saida_desde is None:
+                        conn.saida_desde = agora
+                    elif agora - conn.saida_desde > TCP_TIMEOUT_OCIOSO:
+                        print(f"[TCP] Cliente {conn.addr} não lê as respostas há "
+                              f"{TCP_TIMEOUT_OCIOSO:.0f}s. Fechando.")
+                        fechar(conn)
+                elif agora - conn.ultima_atividade > TCP_TIMEOUT_OCIOSO:
+                    print(f"[TCP] Cliente {conn.addr} ocioso há {TCP_TIMEOUT_OCIOSO:.0f}s.")
+                    fechar(conn)
 
 if __name__ == "__main__":
     
@@ -136,6 +384,10 @@ if __name__ == "__main__":
     tcp_thread = threading.Thread(target=thread_servidor_tcp, daemon=True)
     tcp_thread.start()
 
+    if TELEMETRIA:
+        udp_thread = threading.Thread(target=thread_telemetria, daemon=True)
+        udp_thread.start()
+
     try:
         while True:
             time.sleep(1)
@@ -1,15 +1,50 @@
-import socket
 import datetime
+import json
+import threading
+import time
 from math import sqrt
-from dash import Dash, dcc, html, Input, Output, State, callback_context
+import numpy as np
+from dash import Dash, dcc, html, Input, Output, State, Patch, callback_context
 import plotly.graph_objs as go
+from flask import Response
+from protocolo_clp import ClienteCLP, ReceptorTelemetria, TELEMETRIA_GRUPO, TELEMETRIA_PORTA
+from historiador_bin import HistorianStore
+from escritor_log import obter_escritor
+from exportar_logs import carregar_intervalo, trajetoria_reduzida, aquecer_cache
 
 CLP_HOST = "localhost"
 CLP_PORT = 65432
+CLP_BINARIO = True      # protocolo binário com o CLP (exige CLP.py atualizado; ver README)
 HIST_FILE = "historiador.txt"
 STEP_XY = 0.2
 STEP_Z = 0.2
 MISSION_TOL = 0.25
+POLL_PERIOD = 0.5       # período de consulta ao CLP (s)
+STALE_AFTER = 3.0       # sem resposta do CLP há mais que isso → dado antigo (s)
+PATH_LENGTH = 20000     # pontos guardados da trajetória (buffer circular no servidor)
+TRAIL_POINTS = 400      # pontos da trilha desenhada no mapa após a decimação
+
+# Streaming: o servidor empurra a pose do drone para o navegador por
+# Server-Sent Events (assets/telemetria_sse.js) e o CLP é consultado no
+# ritmo da ponte; o dcc.Interval continua só para missão/target/trilha.
+STREAM_MODE = True
+STREAM_POLL_PERIOD = 0.05   # 20 Hz
+STREAM_KEEPALIVE = 15.0     # comentário SSE para manter a conexão viva (s)
+HIST_PERIOD = 0.5           # intervalo mínimo entre registros no historiador (s)
+
+# Telemetria UDP do CLP: a pose chega passivamente e o CLP só é consultado
+# por TCP quando o target muda ou a telemetria para de chegar.
+TELEMETRY_UDP = True
+TELEMETRY_GROUP = TELEMETRIA_GRUPO
+TELEMETRY_PORT = TELEMETRIA_PORTA
+TELEMETRY_FRESH = 1.0       # telemetria mais antiga que isso → volta a consultar por TCP (s)
+
+# Reprodução: trechos de historiador.txt/mes.txt reduzidos por LTTB
+PLAYBACK_FILES = (HIST_FILE, "mes.txt")
+PLAYBACK_POINTS = 3000
+
+INITIAL_TARGET = {"x": 0.0, "y": 0.0, "z": 1.0}
+INITIAL_DRONE = {"x": 0.0, "y": 0.0, "z": 0.0}
 
 SQUARES = {
     "Q1": {"x": -0.3, "y": -1.8, "z": 1.0},
@@ -19,29 +54,285 @@ SQUARES = {
 }
 
 
-def send_target_and_get_pos(target):
-    msg = f"{target['x']:.3f},{target['y']:.3f},{target['z']:.3f}"
+clp = ClienteCLP(CLP_HOST, CLP_PORT, timeout=1.0, binario=CLP_BINARIO)
+hist_bin = HistorianStore("ihm")
+hist_txt = obter_escritor(HIST_FILE)
+
+
+def send_target_and_get_pos(target, log=True):
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(1.0)
-            s.connect((CLP_HOST, CLP_PORT))
-            s.sendall(msg.encode("utf-8"))
-            data = s.recv(1024)
-        pos_str = data.decode("utf-8").strip()
-        x_d, y_d, z_d = map(float, pos_str.split(","))
+        x_d, y_d, z_d = clp.enviar_xyz((target["x"], target["y"], target["z"]))
     except Exception as e:
         raise RuntimeError(f"Erro TCP: {e}")
-    ts = datetime.datetime.now().isoformat()
-    with open(HIST_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{ts}] Target <{msg}> → CLP <{pos_str}>\n")
+    if log:
+        log_sample(target, x_d, y_d, z_d)
     return x_d, y_d, z_d
 
+
+def log_sample(target, x_d, y_d, z_d):
+    # o texto só é montado para o historiador
+    msg = f"{target['x']:.3f},{target['y']:.3f},{target['z']:.3f}"
+    pos_str = f"{x_d},{y_d},{z_d}"
+    ts = datetime.datetime.now().isoformat()
+    hist_txt.escrever(f"[{ts}] Target <{msg}> → CLP <{pos_str}>\n")
+    hist_bin.append((target["x"], target["y"], target["z"]), (x_d, y_d, z_d))
+
+
+class PathBuffer:
+    """Buffer circular (NumPy) com a trajetória do drone: colunas x, y, z, t."""
+
+    def __init__(self, length=PATH_LENGTH):
+        self.length = length
+        self._data = np.empty((length, 4))
+        self._total = 0     # pontos já gravados desde o início (nº de sequência)
+        self._lock = threading.Lock()
+
+    def append(self, x, y, z, t):
+        with self._lock:
+            self._data[self._total % self.length] = (x, y, z, t)
+            self._total += 1
+
+    def _ordered(self, start):
+        # pontos de número de sequência >= start, do mais antigo ao mais novo
+        idx = np.arange(start, self._total) % self.length
+        return self._data[idx]
+
+    def trail(self, max_points=TRAIL_POINTS):
+        """Trajetória inteira decimada para no máximo max_points, e o nº de sequência."""
+        with self._lock:
+            first = max(0, self._total - self.length)
+            step = max(1, -(-(self._total - first) // max_points))
+            # o último ponto entra sempre, para a trilha terminar no drone
+            start = self._total - 1 - ((self._total - 1 - first) // step) * step
+            points = self._ordered(start)[::step] if self._total else self._data[:0]
+            return points, self._total
+
+    def since(self, seq):
+        """Pontos gravados depois de seq (None se já saíram do buffer)."""
+        with self._lock:
+            if seq < self._total - self.length:
+                return None, self._total
+            return self._ordered(seq), self._total
+
+
+class TelemetryPoller:
+    """Única thread que conversa com o CLP; os callbacks só leem o cache.
+
+    Qualquer número de abas/visualizadores custa uma consulta ao CLP por
+    POLL_PERIOD. O target mais recente informado pelas abas é enviado na
+    próxima consulta (imediatamente, se mudou). Com a telemetria UDP
+    chegando, a pose vem dela e a consulta só é feita quando o target muda.
+    """
+
+    def __init__(self, period=POLL_PERIOD):
+        self.period = period
+        self.path = PathBuffer()
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._thread = None
+        self._target = None
+        self._drone = None
+        self._status = "Aguardando CLP"
+        self._updated_at = None
+        self._seq = 0
+        self._logged_at = 0.0
+        self._changed = False
+        self._udp_at = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clp-poller", daemon=True)
+                self._thread.start()
+                if TELEMETRY_UDP:
+                    threading.Thread(target=self._run_udp, name="clp-telemetria", daemon=True).start()
+
+    def set_target(self, target):
+        with self._lock:
+            changed = target != self._target
+            self._target = dict(target)
+            self._changed |= changed
+        if changed:
+            self._wake.set()
+
+    def latest(self):
+        """Última posição do drone (ou None) e o texto de status."""
+        with self._lock:
+            drone = None if self._drone is None else dict(self._drone)
+            status = self._status
+            updated_at = self._updated_at
+        if status == "OK" and time.monotonic() - updated_at > STALE_AFTER:
+            status = f"Sem resposta do CLP há {time.monotonic() - updated_at:.0f}s"
+        return drone, status
+
+    def wait_update(self, seq, timeout):
+        """Espera uma amostra mais nova que seq; devolve (amostra ou None, seq).
+
+        Sem nenhuma amostra ainda (CLP fora do ar) espera o timeout inteiro."""
+        with self._updated:
+            self._updated.wait_for(lambda: self._seq != seq and self._drone is not None, timeout)
+            if self._seq == seq or self._drone is None:
+                return None, seq
+            return {**self._drone, "target": self._target}, self._seq
+
+    def _publish(self, target, x_d, y_d, z_d):
+        with self._lock:
+            self._drone = {"x": x_d, "y": y_d, "z": z_d}
+            self._status = "OK"
+            self._updated_at = time.monotonic()
+            self._seq += 1
+            self._updated.notify_all()
+            # o historiador continua no ritmo de antes mesmo com amostras a 20 Hz
+            log = self._updated_at - self._logged_at >= HIST_PERIOD
+            if log:
+                self._logged_at = self._updated_at
+        if log:
+            log_sample(target, x_d, y_d, z_d)
+        self.path.append(x_d, y_d, z_d, time.time())
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.period)
+            self._wake.clear()
+            with self._lock:
+                target, changed = self._target, self._changed
+                self._changed = False
+                udp_ok = self._udp_at is not None and time.monotonic() - self._udp_at < TELEMETRY_FRESH
+            if target is None or (udp_ok and not changed):
+                continue
+            try:
+                x_d, y_d, z_d = send_target_and_get_pos(target, log=False)
+            except Exception as e:
+                with self._lock:
+                    self._status = f"Erro TCP/CLP: {e}"
+                    self._changed |= changed   # reenviar quando o CLP voltar
+                continue
+            self._publish(target, x_d, y_d, z_d)
+
+    def _run_udp(self):
+        try:
+            receiver = ReceptorTelemetria(TELEMETRY_GROUP, TELEMETRY_PORT)
+        except OSError as e:
+            print(f"[IHM] Telemetria UDP indisponível ({e}); consultando o CLP por TCP.")
+            return
+        while True:
+            sample = receiver.receber(timeout=TELEMETRY_FRESH)
+            with self._lock:
+                target = self._target
+            if sample is None or target is None:
+                continue
+            x_d, y_d, z_d = sample.pos_drone[0].tolist()
+            # o CLP perdeu o target (reiniciou ou outro cliente o mudou):
+            # a próxima volta de _run o reenvia
+            desync = not np.allclose(sample.pos_target[0], (target["x"], target["y"], target["z"]),
+                                     rtol=0, atol=1e-9)
+            with self._lock:
+                self._udp_at = time.monotonic()
+                self._changed |= desync
+            if desync:
+                self._wake.set()
+            self._publish(target, x_d, y_d, z_d)
+
+
+poller = TelemetryPoller(STREAM_POLL_PERIOD if STREAM_MODE else POLL_PERIOD)
+
+
+def build_map_figure(drone, target):
+    fig_xy = go.Figure()
+    fig_xy.update_layout(
+        xaxis_title="X (m)", yaxis_title="Y (m)",
+        xaxis=dict(scaleanchor="y", scaleratio=1, range=[-3, 3]),
+        yaxis=dict(range=[-3, 3]), plot_bgcolor="#f9f9f9", paper_bgcolor="#ffffff"
+    )
+    fig_xy.add_trace(go.Scatter(x=[drone["x"]], y=[drone["y"]], mode="markers",
+                                name="Drone", marker=dict(size=12, color="#e67e22")))
+    fig_xy.add_trace(go.Scatter(x=[target["x"]], y=[target["y"]], mode="markers",
+                                name="Target", marker=dict(symbol="x", size=12, color="#c0392b")))
+    fig_xy.add_trace(go.Scatter(
+        x=[v["x"] for v in SQUARES.values()],
+        y=[v["y"] for v in SQUARES.values()],
+        mode="markers+text",
+        name="Quadrados",
+        text=list(SQUARES.keys()),
+        textposition="top center",
+        marker=dict(size=12, color="#27ae60", symbol="square")
+    ))
+    fig_xy.add_trace(go.Scatter(x=[], y=[], mode="lines", name="Trajetória",
+                                line=dict(width=2, color="rgba(230,126,34,0.45)")))
+    fig_xy.add_trace(go.Scatter(x=[], y=[], text=[], mode="lines", name="Reprodução",
+                                hovertemplate="%{text}<br>x=%{x:.3f} y=%{y:.3f}<extra></extra>",
+                                line=dict(width=1.5, color="#2980b9")))
+    return fig_xy
+
+
+def build_height_figure(drone, target):
+    fig_z = go.Figure()
+    fig_z.add_trace(go.Scatter(
+        x=[0],
+        y=[drone["z"]],
+        mode="markers",
+        name="Drone",
+        marker=dict(size=25, color="#16a085", symbol="circle")
+    ))
+    fig_z.add_trace(go.Scatter(
+        x=[0],
+        y=[target["z"]],
+        mode="markers",
+        name="Target",
+        marker=dict(size=12, color="#c0392b", symbol="x")
+    ))
+    # reprodução: altura ao longo do tempo, num eixo x próprio
+    fig_z.add_trace(go.Scatter(
+        x=[],
+        y=[],
+        mode="lines",
+        name="Reprodução",
+        xaxis="x2",
+        line=dict(width=1.5, color="#2980b9"),
+    ))
+    fig_z.update_layout(
+        yaxis=dict(range=[0, 3], title="Altura (m)"),
+        xaxis=dict(showticklabels=False),
+        xaxis2=dict(overlaying="x", side="top", type="date", tickformat="%H:%M:%S",
+                    tickfont=dict(size=9)),
+        showlegend=False,
+        margin=dict(l=40, r=10, t=30, b=30),
+        plot_bgcolor="#f9f9f9",
+        paper_bgcolor="#ffffff",
+    )
+    return fig_z
+
+
 app = Dash(__name__)
 app.title = "Supervisório Drone SDA"
 
-store_target = dcc.Store(id="store-target", data={"x": 0.0, "y": 0.0, "z": 1.0})
-store_drone = dcc.Store(id="store-drone", data={"x": 0.0, "y": 0.0, "z": 0.0})
-store_path = dcc.Store(id="store-path", data={"x": [], "y": [], "z": [], "t": []})
+
+@app.server.route("/telemetria/stream")
+def telemetry_stream():
+    """Server-Sent Events com a pose do drone a cada resposta do CLP."""
+    if not STREAM_MODE:
+        # 204 faz o EventSource do navegador desistir de reconectar
+        return Response(status=204)
+    poller.start()
+
+    def events():
+        seq = -1
+        while True:
+            sample, seq = poller.wait_update(seq, STREAM_KEEPALIVE)
+            if sample is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(sample)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+store_target = dcc.Store(id="store-target", data=INITIAL_TARGET)
+store_drone = dcc.Store(id="store-drone", data=INITIAL_DRONE)
+# só o estado da trilha desta aba; a trajetória fica no servidor (PathBuffer)
+store_path = dcc.Store(id="store-path", data={"seq": None, "n": 0})
 store_mission = dcc.Store(id="store-mission", data={"mode": "idle", "index": 0})
 interval = dcc.Interval(id="interval-update", interval=500, n_intervals=0)
 
@@ -121,6 +412,7 @@ app.layout = html.Div(
                             children=[
                                 dcc.Graph(
                                     id="map-graph",
+                                    figure=build_map_figure(INITIAL_DRONE, INITIAL_TARGET),
                                     style={"flex": "1"},
                                     config={"displayModeBar": True, "scrollZoom": True},
                                 ),
@@ -140,6 +432,7 @@ app.layout = html.Div(
                         ),
                         dcc.Graph(
                             id="height-graph",
+                            figure=build_height_figure(INITIAL_DRONE, INITIAL_TARGET),
                             style={
                                 "flex": "1",
                                 "max-width": "300px",
@@ -294,6 +587,57 @@ app.layout = html.Div(
                                        "height": "40px", "margin-top": "40px"}
                             ),
                         ]),
+
+                        # ===== REPRODUÇÃO =====
+                        html.Div([
+                            html.H4("Reprodução", style={
+                                "text-align": "center",
+                                "color": "#34495e",
+                                "font-size": "26px",
+                                "margin-bottom": "10px",
+                            }),
+                            html.Div(
+                                style={"display": "flex", "gap": "4px"},
+                                children=[
+                                    dcc.Input(
+                                        id="input-playback-start",
+                                        type="text",
+                                        placeholder="Início (2025-12-03T09:00)",
+                                        style={"flex": "1", "border-radius": "6px", "padding": "5px"},
+                                    ),
+                                    dcc.Input(
+                                        id="input-playback-end",
+                                        type="text",
+                                        placeholder="Fim (vazio = agora)",
+                                        style={"flex": "1", "border-radius": "6px", "padding": "5px"},
+                                    ),
+                                ],
+                            ),
+                            html.Div(
+                                style={"display": "flex", "gap": "4px", "margin-top": "6px"},
+                                children=[
+                                    html.Button(
+                                        "Carregar",
+                                        id="btn-playback-load",
+                                        n_clicks=0,
+                                        style={**STYLE_BTN, "flex": "1", "background-color": "#2980b9",
+                                               "height": "40px"}
+                                    ),
+                                    html.Button(
+                                        "Limpar",
+                                        id="btn-playback-clear",
+                                        n_clicks=0,
+                                        style={**STYLE_BTN, "flex": "1", "background-color": "#7f8c8d",
+                                               "height": "40px"}
+                                    ),
+                                ],
+                            ),
+                            html.Div(id="playback-info", style={
+                                "font-size": "13px",
+                                "color": "#2c3e50",
+                                "margin-top": "4px",
+                            }),
+                        ]),
                     ],
                 ),
             ],
@@ -331,6 +675,41 @@ def joystick_and_input(n_up, n_down, n_left, n_right, n_zup, n_zdown, n_send, x,
         if z is not None: t["z"] = z
     return t
 
+@app.callback(
+    [Output("map-graph", "figure", allow_duplicate=True),
+     Output("height-graph", "figure", allow_duplicate=True),
+     Output("playback-info", "children")],
+    [Input("btn-playback-load", "n_clicks"), Input("btn-playback-clear", "n_clicks")],
+    [State("input-playback-start", "value"), State("input-playback-end", "value")],
+    prevent_initial_call=True,
+)
+def load_playback(n_load, n_clear, start, end):
+    fig_xy, fig_z = Patch(), Patch()
+    if callback_context.triggered[0]["prop_id"].startswith("btn-playback-clear"):
+        x, y, t, z, info = [], [], [], [], ""
+    else:
+        try:
+            data = carregar_intervalo(start or None, end or None, PLAYBACK_FILES)
+        except ValueError:
+            return fig_xy, fig_z, "Data inválida. Use o formato 2025-12-03T09:00."
+        except OSError as e:
+            return fig_xy, fig_z, f"Falha ao ler o historiador: {e}"
+        total = len(data["ts"])
+        data = trajetoria_reduzida(data, PLAYBACK_POINTS)
+        x, y, z = data["px"].tolist(), data["py"].tolist(), data["pz"].tolist()
+        t = np.datetime_as_string(data["ts"], unit="ms").tolist()
+        if not t:
+            info = "Nenhum registro no intervalo."
+        else:
+            info = f"{total} registros ({t[0]} → {t[-1]}), {len(t)} pontos desenhados"
+    fig_xy["data"][4]["x"] = x
+    fig_xy["data"][4]["y"] = y
+    fig_xy["data"][4]["text"] = t
+    fig_z["data"][2]["x"] = t
+    fig_z["data"][2]["y"] = z
+    return fig_xy, fig_z, info
+
+
 @app.callback(
     Output("store-target", "data", allow_duplicate=True),
     Input("btn-goto-square", "n_clicks"), State("dropdown-square", "value"), State("store-target", "data"), prevent_initial_call=True,
@@ -351,6 +730,24 @@ def start_scan_mission(n_clicks, mission, target):
     first_sq = SQUARES["Q1"]
     return {"mode": "scan", "index": 0}, {"x": first_sq["x"], "y": first_sq["y"], "z": first_sq["z"]}
 
+def update_trail(fig_xy, path):
+    """Estende a trilha da aba só com os pontos novos; de vez em quando a
+    substitui pela trajetória inteira decimada, para mantê-la pequena."""
+    seq, n = path.get("seq"), path.get("n", 0)
+    new = None
+    if seq is not None:
+        new, total = poller.path.since(seq)
+    if new is None or n + len(new) > 2 * TRAIL_POINTS:
+        points, total = poller.path.trail()
+        fig_xy["data"][3]["x"] = points[:, 0].tolist()
+        fig_xy["data"][3]["y"] = points[:, 1].tolist()
+        return {"seq": total, "n": len(points)}
+    if len(new):
+        fig_xy["data"][3]["x"].extend(new[:, 0].tolist())
+        fig_xy["data"][3]["y"].extend(new[:, 1].tolist())
+    return {"seq": total, "n": n + len(new)}
+
+
 @app.callback(
     [
         Output("store-drone", "data"),
@@ -367,13 +764,11 @@ def start_scan_mission(n_clicks, mission, target):
     allow_duplicate=True, prevent_initial_call="initial_duplicate",
 )
 def periodic_update(n_intervals, target, drone, path, mission):
-    new_drone = drone.copy()
-    status = "OK"
-    try:
-        x_d, y_d, z_d = send_target_and_get_pos(target)
-        new_drone = {"x": x_d, "y": y_d, "z": z_d}
-    except Exception as e:
-        status = f"Erro TCP/CLP: {e}"
+    # Só lê o estado mantido pela thread de consulta ao CLP
+    poller.start()
+    poller.set_target(target)
+    latest, status = poller.latest()
+    new_drone = drone.copy() if latest is None else latest
 
     new_mission = mission.copy()
     new_target = target.copy()
@@ -403,56 +798,19 @@ def periodic_update(n_intervals, target, drone, path, mission):
         else:
             new_mission = {"mode": "idle", "index": 0}
     
-    xs, ys, zs, ts = path.get("x", []), path.get("y", []), path.get("z", []), path.get("t", [])
-    xs.append(new_drone["x"]); ys.append(new_drone["y"]); zs.append(new_drone["z"]); ts.append(n_intervals)
-    if len(xs) > 500:
-        xs, ys, zs, ts = xs[-500:], ys[-500:], zs[-500:], ts[-500:]
-    new_path = {"x": xs, "y": ys, "z": zs, "t": ts}
 
-    fig_xy = go.Figure()
-    fig_xy.update_layout(
-        xaxis_title="X (m)", yaxis_title="Y (m)",
-        xaxis=dict(scaleanchor="y", scaleratio=1, range=[-3, 3]),
-        yaxis=dict(range=[-3, 3]), plot_bgcolor="#f9f9f9", paper_bgcolor="#ffffff"
-    )
-    if xs:
-        fig_xy.add_trace(go.Scatter(x=[new_drone["x"]], y=[new_drone["y"]], mode="markers",
-                                    name="Drone", marker=dict(size=12, color="#e67e22")))
-        fig_xy.add_trace(go.Scatter(x=[new_target["x"]], y=[new_target["y"]], mode="markers",
-                                    name="Target", marker=dict(symbol="x", size=12, color="#c0392b")))
-        fig_xy.add_trace(go.Scatter(
-            x=[v["x"] for v in SQUARES.values()],
-            y=[v["y"] for v in SQUARES.values()],
-            mode="markers+text",
-            name="Quadrados",
-            text=list(SQUARES.keys()),
-            textposition="top center",
-            marker=dict(size=12, color="#27ae60", symbol="square")
-        ))
+    # Os gráficos são montados uma vez no layout; aqui só vão as coordenadas
+    # dos marcadores que mudam (Drone e Target)
+    fig_xy = Patch()
+    fig_xy["data"][0]["x"] = [new_drone["x"]]
+    fig_xy["data"][0]["y"] = [new_drone["y"]]
+    fig_xy["data"][1]["x"] = [new_target["x"]]
+    fig_xy["data"][1]["y"] = [new_target["y"]]
+    new_path = update_trail(fig_xy, path)
 
-    fig_z = go.Figure()
-    fig_z.add_trace(go.Scatter(
-        x=[0],
-        y=[new_drone["z"]],
-        mode="markers",
-        name="Drone",
-        marker=dict(size=25, color="#16a085", symbol="circle")
-    ))
-    fig_z.add_trace(go.Scatter(
-        x=[0],
-        y=[new_target["z"]],
-        mode="markers",
-        name="Target",
-        marker=dict(size=12, color="#c0392b", symbol="x")
-    ))
-    fig_z.update_layout(
-        yaxis=dict(range=[0, 3], title="Altura (m)"),
-        xaxis=dict(showticklabels=False),
-        showlegend=False,
-        margin=dict(l=40, r=10, t=30, b=30),
-        plot_bgcolor="#f9f9f9",
-        paper_bgcolor="#ffffff",
-    )
+    fig_z = Patch()
+    fig_z["data"][0]["y"] = [new_drone["z"]]
+    fig_z["data"][1]["y"] = [new_target["z"]]
 
     info = (
         f" Drone ({new_drone['x']:.2f},{new_drone['y']:.2f},{new_drone['z']:.2f}) | "
@@ -463,4 +821,7 @@ def periodic_update(n_intervals, target, drone, path, mission):
 
 
 if __name__ == "__main__":
+    poller.start()
+    # lê os logs uma vez em segundo plano para a primeira reprodução ser rápida
+    threading.Thread(target=aquecer_cache, args=(PLAYBACK_FILES,), daemon=True).start()
     app.run(debug=True, use_reloader=False)
@@ -1,64 +1,136 @@
 import sys
 import time
 import datetime
-from opcua import Server, Client
+import sqlite3
+import threading
+from opcua import Server, ua
+from opcua.server.history_sql import HistorySQLite
+from opcua.ua.ua_binary import variant_to_binary
+from escritor_log import obter_escritor
+from sessao_opc import SessaoOPC, NOMES_DRONE, KEEPALIVE_PERIODO
 
 # --- Configurações ---
 OPCUA_URL = "opc.tcp://localhost:53530/OPCUA/SimulationServer" 
 CHAINED_SERVER_URL = "opc.tcp://localhost:4850/MESServer" 
 FILENAME = "mes.txt"
 NS_MES = "MES_Namespace"
+MES_MODO = "subscription"   # "subscription" ou "polling"
+MES_PUBLISH_MS = 50         # intervalo de publicação da subscription no Prosys (ms)
+MES_PERIODO = 2             # período do polling / verificação da sessão (s)
+MES_LOG_MODO = "deadband"   # "deadband" ou "periodico" (uma linha a cada MES_LOG_PERIODO)
+MES_LOG_PERIODO = 5         # s (modo "periodico" e polling de reserva)
+MES_DEADBAND = 0.001        # variação mínima em qualquer eixo para registrar (m)
+MES_HEARTBEAT = 60          # s sem movimento até registrar uma amostra mesmo assim
+MES_HIST_DB = "mes_historico.db"  # None desliga o histórico OPC UA do chained server
+MES_HIST_DIAS = 7           # retenção por tempo (dias)
+MES_HIST_MAX = 500000       # retenção por quantidade (amostras por variável; 0 = sem limite)
+MES_HIST_LIMPEZA = 60       # intervalo entre as limpezas de retenção (s)
 
 
-# --- Lógica de conexão ---
-def connect_opc(url=OPCUA_URL):
-    client = Client(url)
-    client.connect()
-    print("[OPC] Connected")
+def repassar_valor(dv):
+    """Cópia do DataValue lido do Prosys que preserva o timestamp de origem."""
+    copia = ua.DataValue(dv.Value, dv.StatusCode)
+    copia.SourceTimestamp = dv.SourceTimestamp or datetime.datetime.utcnow()
+    copia.ServerTimestamp = datetime.datetime.utcnow()
+    return copia
 
-    root = client.get_objects_node()
 
-    # Tente achar a pasta "Drone" no ns=3 (padrão do SimulationServer),
-    # e tenha fallback para procurar por nome entre os filhos.
-    drone_folder = None
-    try:
-        drone_folder = root.get_child(["3:Drone"])
-    except Exception:
-        # fallback: varrer filhos e procurar "Drone" 
-        for n in root.get_children():
-            try:
-                name = n.get_browse_name().Name
-                if name.lower() == "drone": 
-                    drone_folder = n
-                    break
-            except Exception:
-                pass
-    if drone_folder is None:
-        raise RuntimeError("Não encontrei a pasta 'Drone' no servidor OPC UA.") 
-
-    # Mapeie variáveis por nome (case-insensitive)
-    name_to_node = {}
-    for v in drone_folder.get_children():
+class RepassaMudancas:
+    """Handler da subscription no Prosys: cada mudança vai direto para a
+    variável correspondente do chained server."""
+
+    def __init__(self, destinos_por_nodeid):
+        self.destinos = destinos_por_nodeid
+
+    def datachange_notification(self, node, val, data):
+        destino = self.destinos.get(node.nodeid)
+        if destino is None:
+            return
         try:
-            nm = v.get_browse_name().Name
-            name_to_node[nm.lower()] = v
-        except Exception:
-            pass
-
-    dX = name_to_node.get("dronex") 
-    dY = name_to_node.get("droney") 
-    dZ = name_to_node.get("dronez") 
-
-    if not all([dX, dY, dZ]):
-        found = ", ".join(sorted(name_to_node.keys()))
-        raise RuntimeError(
-            "Variáveis do Drone não encontradas. "
-            "Quero DroneX, DroneY, DroneZ. "
-            f"Encontradas: {found}"
-        )
-
-    print("[OPC] Vars bound:", "DroneX/DroneY/DroneZ")
-    return client, (dX, dY, dZ)
+            destino.set_value(repassar_valor(data.monitored_item.Value))
+        except Exception as e:
+            print(f"[Chained-Server] Falha ao repassar {node}: {e}")
+
+    def status_change_notification(self, status):
+        print(f"[Chained-Server] Status da subscription: {status}")
+
+
+class HistoricoMES(HistorySQLite):
+    """Histórico SQLite do chained server. Cada amostra é só um INSERT (em WAL
+    com synchronous=NORMAL o commit não espera o disco); a retenção por
+    tempo e por quantidade, que o HistorySQLite aplica a cada amostra, roda
+    numa thread a cada MES_HIST_LIMPEZA segundos."""
+
+    def __init__(self, path=MES_HIST_DB, limpeza=MES_HIST_LIMPEZA):
+        super().__init__(path)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._parar = threading.Event()
+        self._thread_limpeza = threading.Thread(target=self._limpar_periodicamente, args=(limpeza,),
+                                                name="mes-hist-retencao", daemon=True)
+        self._thread_limpeza.start()
+
+    def new_historized_node(self, node_id, period, count=0):
+        super().new_historized_node(node_id, period, count)
+        tabela = self._get_table_name(node_id)
+        with self._lock:
+            # HistoryRead e a retenção filtram por SourceTimestamp
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{tabela}_SourceTimestamp" '
+                               f'ON "{tabela}" (SourceTimestamp)')
+            self._conn.commit()
+
+    def save_node_value(self, node_id, datavalue):
+        tabela = self._get_table_name(node_id)
+        with self._lock:
+            try:
+                self._conn.execute(f'INSERT INTO "{tabela}" VALUES (NULL, ?, ?, ?, ?, ?, ?)', (
+                    datavalue.ServerTimestamp,
+                    datavalue.SourceTimestamp,
+                    datavalue.StatusCode.value,
+                    str(datavalue.Value.Value),
+                    datavalue.Value.VariantType.name,
+                    sqlite3.Binary(variant_to_binary(datavalue.Value)),
+                ))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.logger.error("Historizing SQL Insert Error for %s: %s", node_id, e)
+
+    def aplicar_retencao(self):
+        """Apaga, de cada variável, as amostras mais velhas que o período e as
+        que passam da quantidade máxima (as mais antigas, pela ordem de inserção)."""
+        for node_id, (periodo, maximo) in list(self._datachanges_period.items()):
+            tabela = self._get_table_name(node_id)
+            with self._lock:
+                try:
+                    if periodo:
+                        limite = datetime.datetime.utcnow() - periodo
+                        self._conn.execute(f'DELETE FROM "{tabela}" WHERE SourceTimestamp < ?', (limite,))
+                    if maximo:
+                        self._conn.execute(
+                            f'DELETE FROM "{tabela}" WHERE _Id <= (SELECT _Id FROM "{tabela}" '
+                            f'ORDER BY _Id DESC LIMIT 1 OFFSET ?)', (maximo,))
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    self.logger.error("Historizing SQL Delete Old Data Error for %s: %s", node_id, e)
+
+    def _limpar_periodicamente(self, intervalo):
+        while not self._parar.wait(intervalo):
+            self.aplicar_retencao()
+
+    def stop(self):
+        self._parar.set()
+        super().stop()
+
+
+def historizar(server, variaveis):
+    """Grava as mudanças das variáveis em MES_HIST_DB e atende HistoryRead."""
+    server.iserver.history_manager.set_storage(HistoricoMES(MES_HIST_DB))
+    periodo = datetime.timedelta(days=MES_HIST_DIAS)
+    for var in variaveis:
+        server.historize_node_data_change(var, period=periodo, count=MES_HIST_MAX)
+    print(f"[Chained-Server] Histórico em {MES_HIST_DB} ({MES_HIST_DIAS} dias, até {MES_HIST_MAX} amostras).")
+
 
 def start_chained_server():
 
@@ -85,40 +157,156 @@ def start_chained_server():
     server.start()
     print(f"[Chained-Server] Servidor MES rodando em {CHAINED_SERVER_URL}")
 
+    # Histórico OPC UA (HistoryRead) das três variáveis
+    if MES_HIST_DB:
+        historizar(server, [mes_var_x, mes_var_y, mes_var_z])
+
     # Configura o cliente para ler do Prosys
+    destinos = {"x": mes_var_x, "y": mes_var_y, "z": mes_var_z}
+    sessao = SessaoOPC(OPCUA_URL, NOMES_DRONE, tag="Chained-Server")
     while True:
+        # Conecta ao Prosys e obtém os nós do Drone (backoff entre tentativas)
+        client_prosys, (prosys_x, prosys_y, prosys_z) = sessao.conectar()
         try:
-            # Conecta ao Prosys e obtém os nós do Drone
-            client_prosys, (prosys_x, prosys_y, prosys_z) = connect_opc(OPCUA_URL)
+            sub = None
+            if MES_MODO == "subscription":
+                try:
+                    handler = RepassaMudancas({
+                        prosys_x.nodeid: mes_var_x,
+                        prosys_y.nodeid: mes_var_y,
+                        prosys_z.nodeid: mes_var_z,
+                    })
+                    sub = client_prosys.create_subscription(MES_PUBLISH_MS, handler)
+                    sub.subscribe_data_change([prosys_x, prosys_y, prosys_z])
+                    print(f"[Chained-Server] Subscription ativa no Prosys ({MES_PUBLISH_MS} ms).")
+                except Exception as e:
+                    print(f"[Chained-Server] Subscription indisponível ({e}). Usando polling.")
+                    sub = None
 
             while True:
-                try:
-                    # Lê o valor do Prosys
-                    val_x = prosys_x.get_value()
-                    val_y = prosys_y.get_value()
-                    val_z = prosys_z.get_value()
-                    
-                    # Escreve o valor no chained server
-                    mes_var_x.set_value(val_x)
-                    mes_var_y.set_value(val_y)
-                    mes_var_z.set_value(val_z)
-                    
+                if sub is None:
+                    # Lê o valor do Prosys (com o timestamp de origem)
+                    # e escreve o valor no chained server
+                    for eixo, no in (("x", prosys_x), ("y", prosys_y), ("z", prosys_z)):
+                        destinos[eixo].set_value(repassar_valor(no.get_data_value()))
                     print(f"[Chained-Server] Dados atualizados.")
-                    
-                except Exception as e_loop:
-                    print(f"[Chained-Server] Erro no loop de dados: {e_loop}")
-                    client_prosys.disconnect()
-                    break # Tenta reconectar o cliente
-                    
-                time.sleep(2) 
-
-        except Exception as e_conn:
-            print(f"[Chained-Server] Erro de conexão com Prosys: {e_conn}. Tentando em 5s...")
-            time.sleep(5)
-            
+
+                # os valores chegam pelo handler; a sessão é vigiada pelo keep-alive
+                if sessao.caiu.wait(MES_PERIODO):
+                    raise ConnectionError("keep-alive sem resposta")
+
+        except Exception as e:
+            sessao.falhou(e)
+
     server.stop()
 
 
+def registrar(log_mes, valores, instante=None):
+    """Enfileira uma linha no formato de mes.txt."""
+    if instante is None:
+        instante = datetime.datetime.now()
+    val_x, val_y, val_z = valores
+    linha = f"[{instante.isoformat()}] - X={val_x:.4f}, Y={val_y:.4f}, Z={val_z:.4f}\n"
+
+    # Salva em mes.txt (gravação em lote pela thread do escritor)
+    if log_mes.escrever(linha):
+        print("[Cliente-MES] Log realizado.")
+    else:
+        print("[Cliente-MES] Fila de gravação cheia; registro descartado.")
+
+
+def _hora_local(ts_utc):
+    # os timestamps OPC UA chegam em UTC sem fuso; o log usa a hora local
+    return ts_utc.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+
+
+class AmostrasMES:
+    """Handler da subscription no chained server: guarda o último valor de
+    cada eixo (com o timestamp de origem) e avisa o laço de log."""
+
+    def __init__(self, eixos_por_nodeid):
+        self.eixos = eixos_por_nodeid
+        self.valores = [None, None, None]
+        self.instante = None
+        self.mudou = threading.Event()
+        self._lock = threading.Lock()
+
+    def datachange_notification(self, node, val, data):
+        eixo = self.eixos.get(node.nodeid)
+        if eixo is None:
+            return
+        ts = data.monitored_item.Value.SourceTimestamp
+        with self._lock:
+            self.valores[eixo] = float(val)
+            self.instante = _hora_local(ts) if ts is not None else datetime.datetime.now()
+        self.mudou.set()
+
+    def status_change_notification(self, status):
+        print(f"[Cliente-MES] Status da subscription: {status}")
+
+    def atualizar(self, valores):
+        with self._lock:
+            self.valores = [float(v) for v in valores]
+            self.instante = datetime.datetime.now()
+
+    def ler(self):
+        with self._lock:
+            return list(self.valores), self.instante
+
+
+def registrar_mudancas(client_mes, node_x, node_y, node_z, log_mes, caiu):
+    """Modo deadband: registra uma amostra quando algum eixo se move mais que
+    MES_DEADBAND desde a última linha gravada, ou a cada MES_HEARTBEAT sem
+    movimento. Só retorna por exceção (sessão perdida ou `caiu` sinalizado
+    pelo keep-alive)."""
+    nos = [node_x, node_y, node_z]
+    amostras = AmostrasMES({no.nodeid: i for i, no in enumerate(nos)})
+    sub = client_mes.create_subscription(MES_PUBLISH_MS, amostras)
+    sub.subscribe_data_change(nos)
+    print(f"[Cliente-MES] Subscription ativa (deadband {MES_DEADBAND}, heartbeat {MES_HEARTBEAT} s).")
+
+    ultimo = None
+    t_ultimo = time.monotonic()
+    while True:
+        restante = MES_HEARTBEAT - (time.monotonic() - t_ultimo)
+        mudou = amostras.mudou.wait(min(max(restante, 0.0), KEEPALIVE_PERIODO))
+        if caiu.is_set():
+            raise ConnectionError("keep-alive sem resposta")
+        if not mudou:
+            if restante > KEEPALIVE_PERIODO:
+                continue
+            # nenhuma mudança até o heartbeat: lê direto (também verifica a sessão)
+            amostras.atualizar(client_mes.get_values(nos))
+        amostras.mudou.clear()
+
+        valores, instante = amostras.ler()
+        if None in valores:
+            continue
+        movimento = ultimo is None or any(abs(v - u) > MES_DEADBAND for v, u in zip(valores, ultimo))
+        heartbeat = time.monotonic() - t_ultimo >= MES_HEARTBEAT
+        if not (movimento or heartbeat):
+            continue
+
+        registrar(log_mes, valores, instante if movimento else datetime.datetime.now())
+        ultimo = valores
+        t_ultimo = time.monotonic()
+
+
+def ligar_nos_mes(client_mes):
+    # --- Busca de nós ---
+    # Encontra o índice do namespace que o chained server criou e encontra o objeto "MES_Data"
+    ns_idx_mes = client_mes.get_namespace_index(NS_MES)
+    objects_node = client_mes.get_objects_node()
+    mes_data_obj = objects_node.get_child(f"{ns_idx_mes}:MES_Data")
+
+    # Encontra as variáveis dentro do objeto
+    node_x = mes_data_obj.get_child(f"{ns_idx_mes}:Drone_X_MES")
+    node_y = mes_data_obj.get_child(f"{ns_idx_mes}:Drone_Y_MES")
+    node_z = mes_data_obj.get_child(f"{ns_idx_mes}:Drone_Z_MES")
+    print("[Cliente-MES] Conectado ao Chained Server.")
+    return node_x, node_y, node_z
+
+
 def iniciar_cliente_mes():
     
     # MODO CLIENTE:
@@ -128,46 +316,26 @@ def iniciar_cliente_mes():
     print("[Cliente-MES] Iniciando...")
     print(f"[Cliente-MES] Conectando ao Chained Server em {CHAINED_SERVER_URL}")
     
-    client_mes = Client(CHAINED_SERVER_URL)
+    log_mes = obter_escritor(FILENAME)
+    sessao = SessaoOPC(CHAINED_SERVER_URL, tag="Cliente-MES", ligar=ligar_nos_mes)
 
     while True:
+        client_mes, (node_x, node_y, node_z) = sessao.conectar()
         try:
-            client_mes.connect()
-            print("[Cliente-MES] Conectado ao Chained Server.")
-            
-            # --- Busca de nós ---
-            # Encontra o índice do namespace que o chained server criou e encontra o objeto "MES_Data"
-            ns_idx_mes = client_mes.get_namespace_index(NS_MES)
-            objects_node = client_mes.get_objects_node()
-            mes_data_obj = objects_node.get_child(f"{ns_idx_mes}:MES_Data")
-            
-            # Encontra as variáveis dentro do objeto
-            node_x = mes_data_obj.get_child(f"{ns_idx_mes}:Drone_X_MES")
-            node_y = mes_data_obj.get_child(f"{ns_idx_mes}:Drone_Y_MES")
-            node_z = mes_data_obj.get_child(f"{ns_idx_mes}:Drone_Z_MES")
-
             print("[Cliente-MES] Nós do chained server vinculados. Iniciando log...")
 
+            if MES_LOG_MODO == "deadband":
+                registrar_mudancas(client_mes, node_x, node_y, node_z, log_mes, sessao.caiu)
+
             while True:
                 val_x = node_x.get_value()
                 val_y = node_y.get_value()
                 val_z = node_z.get_value()
-                
-                timestamp = datetime.datetime.now().isoformat()
-                linha = f"[{timestamp}] - X={val_x:.4f}, Y={val_y:.4f}, Z={val_z:.4f}\n"
-                                
-                # Salva em mes.txt
-                with open(FILENAME, "a", encoding="utf-8") as f:
-                    f.write(linha)
-
-                print("[Cliente-MES] Log realizado.")
-
-                time.sleep(5) 
+                registrar(log_mes, (val_x, val_y, val_z))
+                time.sleep(MES_LOG_PERIODO)
 
         except Exception as e:
-            print(f"\n[Cliente-MES] Erro: {e}. Tentando reconectar em 5s...")
-            client_mes.disconnect()
-            time.sleep(5)
+            sessao.falhou(e)
 
 # --- Seletor de Execução ---
 if __name__ == "__main__":
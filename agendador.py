@@ -0,0 +1,76 @@
+import math
+import time
+
+############################
+# Agendador de taxa fixa
+############################
+# Acorda em prazos absolutos (time.monotonic) em vez de dormir um período
+# depois do trabalho, então o tempo de I/O não se soma ao período e o laço
+# não deriva. Quando um tick atrasa além do prazo seguinte (overrun):
+#   "skip"    – descarta os prazos perdidos e segue na grade original;
+#   "catchup" – executa os ticks perdidos em sequência, sem dormir, até
+#               alcançar a grade (limitado a MAX_CATCHUP ticks).
+# wait() devolve o tempo a integrar no tick: em "skip" o tempo real desde o
+# tick anterior; em "catchup" sempre o período nominal, pois cada tick
+# recuperado ocupa um prazo da grade (o tempo real entre eles é ~0).
+
+MAX_CATCHUP = 10
+
+
+class FixedRateScheduler:
+    """Laço periódico com prazos absolutos e estatísticas de jitter."""
+
+    def __init__(self, period, policy="skip"):
+        if policy not in ("skip", "catchup"):
+            raise ValueError(f"Política de overrun desconhecida: {policy}")
+        self.period = period
+        self.policy = policy
+        agora = time.monotonic()
+        self.deadline = agora + period
+        self.last = agora
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self._soma = 0.0
+        self._soma_jit2 = 0.0
+        self._jit_max = 0.0
+
+    def wait(self):
+        """Dorme até o próximo prazo e devolve o passo de tempo do tick: o tempo
+        real desde o tick anterior ("skip") ou o período nominal ("catchup")."""
+        agora = time.monotonic()
+        if agora < self.deadline:
+            time.sleep(self.deadline - agora)
+            agora = time.monotonic()
+        else:
+            self.overruns += 1
+            perdidos = int((agora - self.deadline) // self.period)
+            if perdidos and (self.policy == "skip" or perdidos > MAX_CATCHUP):
+                self.deadline += perdidos * self.period
+                self.skipped += perdidos
+
+        dt = agora - self.last
+        self.last = agora
+        self.deadline += self.period
+
+        jit = dt - self.period
+        self.ticks += 1
+        self._soma += dt
+        self._soma_jit2 += jit * jit
+        self._jit_max = max(self._jit_max, abs(jit))
+        return self.period if self.policy == "catchup" else dt
+
+    def stats(self):
+        """Período médio, jitter (RMS e máx.), overruns e ticks pulados desde o último reset."""
+        n = max(self.ticks, 1)
+        return {
+            "ticks": self.ticks,
+            "period_mean": self._soma / n,
+            "jitter_rms": math.sqrt(self._soma_jit2 / n),
+            "jitter_max": self._jit_max,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+        }
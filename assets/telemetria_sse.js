@@ -0,0 +1,41 @@
+// Recebe a pose do drone por Server-Sent Events (/telemetria/stream) e move
+// os marcadores direto no Plotly, sem passar pelos callbacks do Dash.
+// Ordem dos traços definida em build_map_figure/build_height_figure:
+// 0 = Drone, 1 = Target.
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+
+    function graph(id) {
+        var el = document.getElementById(id);
+        return el ? el.querySelector(".js-plotly-plot") : null;
+    }
+
+    var pending = null;
+
+    function draw() {
+        var s = pending;
+        pending = null;
+        if (!s || !window.Plotly) {
+            return;
+        }
+        var map = graph("map-graph");
+        var height = graph("height-graph");
+        if (map && map.data) {
+            window.Plotly.restyle(map, {x: [[s.x]], y: [[s.y]]}, [0]);
+        }
+        if (height && height.data) {
+            window.Plotly.restyle(height, {y: [[s.z]]}, [0]);
+        }
+    }
+
+    var source = new EventSource("/telemetria/stream");
+    source.onmessage = function (ev) {
+        // várias amostras entre dois quadros: desenha só a mais nova
+        if (pending === null) {
+            window.requestAnimationFrame(draw);
+        }
+        pending = JSON.parse(ev.data);
+    };
+})();
@@ -0,0 +1,339 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import platform
+import datetime
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from opcua import Server, Client
+
+import CLP
+import MES
+import brigde
+from protocolo_clp import ClienteCLP
+from sessao_opc import NOMES_TARGET, NOMES_DRONE
+from sim_headless import SimHeadless
+from escritor_log import fechar_todos
+
+############################
+# Benchmark ponta a ponta
+############################
+# Sobe no mesmo processo um servidor OPC UA local (no lugar do Prosys, com
+# a pasta Drone e as variáveis Target*/Drone*), o CoppeliaSim sem interface
+# (sim_headless.py) e as threads reais do CLP, da ponte e do chained server
+# do MES, cada um em portas livres. O caminho da IHM é o mesmo ClienteCLP
+# (TCP com enquadramento por linha) que ela usa.
+#
+# Cada ensaio envia pelo TCP um degrau de DEGRAU m em X e mede, varrendo
+# todas as sondas em laço, o primeiro instante em que cada ponto do
+# caminho mudou:
+#
+#   IHM -TCP-> CLP -OPC-> Prosys -> ponte -ZMQ-> sim -> ponte -> Prosys
+#                                                 Prosys -> CLP -TCP-> IHM
+#                                                 Prosys -> chained server MES
+#
+# A resolução das medidas é o tempo de uma varredura (resolucao_ms no
+# resultado). Os resultados vão para BENCH_DIR/bench-<data>.json para
+# comparar execuções ao longo do tempo.
+#
+# Uso: python benchmark.py [n_ensaios]
+
+BENCH_DIR = "benchmarks"
+ENSAIOS = 30
+DEGRAU = 0.05               # m
+ALVO_BASE = (0.0, 0.0, 1.2)
+EPS = 1e-6                  # mudança mínima, no sentido do degrau, para contar como "mudou"
+TOL_ASSENTAR = 1e-5         # m
+TIMEOUT_ENSAIO = 5.0        # s
+DURACAO_VAZAO = 2.0         # s
+LOTE_BINARIO = 32           # pedidos por envio na vazão do protocolo binário em pipeline
+TIMEOUT_INICIO = 15.0       # s
+
+# saltos calculados a partir dos instantes de cada sonda (desde o envio)
+SALTOS = (
+    ("clp_para_opc", None, "opc_target"),
+    ("opc_para_sim", "opc_target", "sim_target"),
+    ("sim_para_opc", "sim_target", "opc_drone"),
+    ("opc_para_clp", "opc_drone", "clp"),
+    ("opc_para_mes", "opc_drone", "mes"),
+    ("comando_movimento", None, "opc_drone"),
+    ("comando_ihm", None, "ihm"),
+)
+
+_saida = sys.__stdout__
+
+
+def log(msg):
+    # os módulos testados imprimem bastante; o benchmark escreve direto no terminal
+    print(msg, file=_saida, flush=True)
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def aguardar(condicao, timeout, descricao):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            if condicao():
+                return
+        except Exception:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"Tempo esgotado esperando {descricao}.")
+
+
+def resumo(amostras):
+    """Percentis (ms) de uma lista de durações em segundos."""
+    a = np.asarray(amostras, dtype=np.float64) * 1e3
+    if not len(a):
+        return {"n": 0}
+    p50, p90, p99 = np.percentile(a, [50, 90, 99])
+    return {"n": int(len(a)), "media": float(a.mean()), "p50": float(p50),
+            "p90": float(p90), "p99": float(p99), "max": float(a.max())}
+
+
+def versao_git():
+    try:
+        r = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return r.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def iniciar_servidor_opc(url):
+    """Servidor no lugar do Prosys: pasta "Drone" em ns=3, como no SimulationServer."""
+    server = Server()
+    server.set_endpoint(url)
+    server.register_namespace("urn:sda:benchmark")
+    ns = server.register_namespace("urn:sda:benchmark:drone")
+    pasta = server.get_objects_node().add_folder(ns, "Drone")
+    variaveis = {}
+    for nome, valor in zip(NOMES_TARGET + NOMES_DRONE, ALVO_BASE + ALVO_BASE):
+        variaveis[nome] = pasta.add_variable(ns, nome, valor)
+        variaveis[nome].set_writable()
+    server.start()
+    return server, variaveis
+
+
+class Bancada:
+    """Sistema completo rodando em threads, com as sondas de cada salto."""
+
+    def __init__(self):
+        self.url_opc = f"opc.tcp://127.0.0.1:{porta_livre()}/benchmark"
+        self.url_mes = f"opc.tcp://127.0.0.1:{porta_livre()}/MESServer"
+        self.porta_tcp = porta_livre()
+        self.porta_sim = porta_livre()
+
+    def iniciar(self):
+        self.server, self.vars = iniciar_servidor_opc(self.url_opc)
+        self.sim = SimHeadless(port=self.porta_sim).iniciar()
+        self.sim.colocar(brigde.DRONE_PATH, ALVO_BASE)
+        self.sim.colocar(brigde.TARGET_PATH, ALVO_BASE)
+
+        CLP.OPCUA_URL, CLP.TCP_HOST, CLP.TCP_PORT = self.url_opc, "127.0.0.1", self.porta_tcp
+        MES.OPCUA_URL, MES.CHAINED_SERVER_URL = self.url_opc, self.url_mes
+        brigde.OPCUA_URL, brigde.SIM_HOST, brigde.SIM_PORT = self.url_opc, "127.0.0.1", self.porta_sim
+        # o CLP começa com target (0,0,0); o primeiro comando já é a base
+        with CLP.lock_data:
+            CLP.pos_target[0] = ALVO_BASE
+
+        for alvo in (CLP.thread_servidor_tcp, CLP.thread_opcua_client, brigde.main, MES.start_chained_server):
+            threading.Thread(target=alvo, name=alvo.__qualname__, daemon=True).start()
+
+        self.ihm = ClienteCLP("127.0.0.1", self.porta_tcp, timeout=2.0)
+        aguardar(lambda: self.ihm.enviar(self.comando(ALVO_BASE[0])), TIMEOUT_INICIO, "o CLP")
+        aguardar(lambda: self.sim.ticks > 0, TIMEOUT_INICIO, "a ponte")
+
+        self.cliente_mes = Client(self.url_mes)
+        aguardar(self._conectar_mes, TIMEOUT_INICIO, "o chained server do MES")
+
+        self.sondas = {
+            "opc_target": lambda: self.vars["TargetX"].get_value(),
+            "sim_target": lambda: self.sim.posicao(brigde.TARGET_PATH)[0],
+            "opc_drone": lambda: self.vars["DroneX"].get_value(),
+            "clp": self._clp_x,
+            "mes": lambda: self.no_mes_x.get_value(),
+            "ihm": lambda: float(self.ihm.enviar(self.comando(self.x_atual)).split(",")[0]),
+        }
+
+    def _conectar_mes(self):
+        self.cliente_mes.connect()
+        ns = self.cliente_mes.get_namespace_index(MES.NS_MES)
+        self.no_mes_x = self.cliente_mes.get_objects_node().get_child(
+            [f"{ns}:MES_Data", f"{ns}:Drone_X_MES"])
+        return True
+
+    def _clp_x(self):
+        with CLP.lock_data:
+            return CLP.pos_drone[0, 0]
+
+    @staticmethod
+    def comando(x):
+        return f"{x:.6f},{ALVO_BASE[1]:.6f},{ALVO_BASE[2]:.6f}"
+
+    def assentado(self, x):
+        return all(abs(self.sondas[n]() - x) <= TOL_ASSENTAR for n in ("opc_drone", "clp", "mes"))
+
+    def ensaio(self, x_novo):
+        """Um degrau de target; devolve (ida e volta TCP, {sonda: instante}, tempo por varredura)."""
+        # o drone segue o target assintoticamente: só conta o movimento no
+        # sentido do degrau, a partir do valor de cada sonda antes do envio
+        sentido = 1.0 if x_novo > self.x_atual else -1.0
+        antes = {nome: sonda() for nome, sonda in self.sondas.items()}
+        self.x_atual = x_novo
+        t0 = time.perf_counter()
+        self.ihm.enviar(self.comando(x_novo))
+        t_tcp = time.perf_counter() - t0
+
+        instantes, varreduras = {}, 0
+        pendentes = list(self.sondas)
+        while pendentes and time.perf_counter() - t0 < TIMEOUT_ENSAIO:
+            varreduras += 1
+            for nome in list(pendentes):
+                if sentido * (self.sondas[nome]() - antes[nome]) > EPS:
+                    instantes[nome] = time.perf_counter() - t0
+                    pendentes.remove(nome)
+        duracao = time.perf_counter() - t0
+        aguardar(lambda: self.assentado(x_novo), TIMEOUT_ENSAIO, "o drone assentar")
+        return t_tcp, instantes, duracao / max(varreduras, 1)
+
+    def vazao_tcp(self, duracao=DURACAO_VAZAO):
+        """Pedidos por segundo numa conexão persistente (caminho da IHM)."""
+        cmd = self.comando(self.x_atual)
+        latencias = []
+        fim = time.perf_counter() + duracao
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= fim:
+                break
+            self.ihm.enviar(cmd)
+            latencias.append(time.perf_counter() - t0)
+        return len(latencias) / duracao, latencias
+
+    def vazao_tcp_binaria(self, duracao=DURACAO_VAZAO, lote=1):
+        """Pedidos por segundo pelo protocolo binário, lote pedidos por envio."""
+        cliente = ClienteCLP("127.0.0.1", self.porta_tcp, timeout=2.0, binario=True)
+        pedidos = [(1, (self.x_atual, ALVO_BASE[1], ALVO_BASE[2]))] * lote
+        n = 0
+        fim = time.perf_counter() + duracao
+        while time.perf_counter() < fim:
+            cliente.enviar_lote(pedidos)
+            n += lote
+        cliente.fechar()
+        return n / duracao
+
+    def parar(self):
+        for acao in (self.cliente_mes.disconnect, self.sim.parar, self.server.stop):
+            try:
+                acao()
+            except Exception:
+                pass
+
+
+def executar(n_ensaios=ENSAIOS):
+    bancada = Bancada()
+    log("[BENCH] Iniciando servidor OPC UA, simulador, CLP, ponte e MES...")
+    bancada.iniciar()
+    bancada.x_atual = ALVO_BASE[0]
+    aguardar(lambda: bancada.assentado(ALVO_BASE[0]), TIMEOUT_INICIO, "o estado inicial")
+
+    tcp, saltos, resolucao, falhas = [], {nome: [] for nome, _, _ in SALTOS}, [], 0
+    log(f"[BENCH] {n_ensaios} ensaios (degrau de {DEGRAU} m em X)...")
+    for i in range(n_ensaios):
+        x_novo = ALVO_BASE[0] + (DEGRAU if i % 2 == 0 else 0.0)
+        try:
+            t_tcp, instantes, t_varredura = bancada.ensaio(x_novo)
+        except RuntimeError as e:
+            log(f"[BENCH] Ensaio {i + 1}: {e}")
+            falhas += 1
+            continue
+        tcp.append(t_tcp)
+        resolucao.append(t_varredura)
+        for nome, de, para in SALTOS:
+            if para in instantes and (de is None or de in instantes):
+                saltos[nome].append(instantes[para] - (instantes[de] if de else 0.0))
+        if len(instantes) < len(bancada.sondas):
+            falhas += 1
+
+    log("[BENCH] Medindo vazão...")
+    ticks0, req0, t0 = bancada.sim.ticks, bancada.sim.requisicoes, time.perf_counter()
+    req_s, latencias_vazao = bancada.vazao_tcp()
+    duracao = time.perf_counter() - t0
+    vazao = {
+        "tcp_req_s": req_s,
+        "tcp_latencia_ms": resumo(latencias_vazao),
+        "ponte_ticks_s": (bancada.sim.ticks - ticks0) / duracao,
+        "sim_req_s": (bancada.sim.requisicoes - req0) / duracao,
+    }
+    vazao["tcp_bin_req_s"] = bancada.vazao_tcp_binaria()
+    vazao["tcp_bin_lote_req_s"] = bancada.vazao_tcp_binaria(lote=LOTE_BINARIO)
+    bancada.parar()
+
+    return {
+        "inicio": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git": versao_git(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "config": {
+            "ensaios": n_ensaios,
+            "degrau_m": DEGRAU,
+            "ponte_dt": brigde.DT,
+            "ponte_sim_mode": brigde.SIM_MODE,
+            "ponte_traj": brigde.TRAJ_PERFIL,
+            "clp_opc_modo": CLP.OPC_MODO,
+            "clp_publish_ms": CLP.OPC_PUBLISH_MS,
+            "mes_modo": MES.MES_MODO,
+            "mes_publish_ms": MES.MES_PUBLISH_MS,
+        },
+        "falhas": falhas,
+        "resolucao_ms": resumo(resolucao)["media"] if resolucao else None,
+        "latencias_ms": {"tcp_ida_volta": resumo(tcp), **{n: resumo(a) for n, a in saltos.items()}},
+        "vazao": vazao,
+    }
+
+
+def imprimir(resultado):
+    log(f"\n{'salto':<20}{'n':>5}{'média':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'máx':>9}  (ms)")
+    for nome, r in resultado["latencias_ms"].items():
+        if r["n"]:
+            log(f"{nome:<20}{r['n']:>5}{r['media']:>9.2f}{r['p50']:>9.2f}"
+                f"{r['p90']:>9.2f}{r['p99']:>9.2f}{r['max']:>9.2f}")
+        else:
+            log(f"{nome:<20}{0:>5}  sem amostras")
+    v = resultado["vazao"]
+    log(f"\nTCP: texto {v['tcp_req_s']:.0f} pedidos/s, binário {v['tcp_bin_req_s']:.0f}, "
+        f"binário em lotes de {LOTE_BINARIO} {v['tcp_bin_lote_req_s']:.0f} | ponte: {v['ponte_ticks_s']:.1f} ticks/s | "
+        f"sim: {v['sim_req_s']:.1f} req/s | resolução {resultado['resolucao_ms']:.2f} ms | "
+        f"falhas {resultado['falhas']}")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else ENSAIOS
+    destino_dir = os.path.abspath(BENCH_DIR)
+    os.makedirs(destino_dir, exist_ok=True)
+
+    # logs, histórico e cache de nós dos módulos ficam numa pasta temporária
+    os.chdir(tempfile.mkdtemp(prefix="sda_bench_"))
+    logging.getLogger("opcua").setLevel(logging.ERROR)
+    sys.stdout = open(os.devnull, "w")
+
+    resultado = executar(n)
+    imprimir(resultado)
+    destino = os.path.join(destino_dir, f"bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(destino, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    log(f"\n[BENCH] Resultados salvos em {destino}")
+
+    # as threads de CLP, ponte e MES não têm parada: encerra o processo
+    fechar_todos()
+    os._exit(0)
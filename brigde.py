@@ -1,7 +1,9 @@
+import sys
 import time
-import math
-from opcua import Client
+import numpy as np
+from sessao_opc import SessaoOPC, vincular_drones
 from coppeliasim_zmqremoteapi_client import RemoteAPIClient
+from agendador import FixedRateScheduler
 
 ############################
 # CONFIG
@@ -9,74 +11,102 @@ from coppeliasim_zmqremoteapi_client import RemoteAPIClient
 OPCUA_URL   = "opc.tcp://localhost:53530/OPCUA/SimulationServer"
 DRONE_PATH  = "/Quadcopter/base"
 TARGET_PATH = "/target"
+SIM_HOST    = "localhost"
+SIM_PORT    = 23000         # porta da ZMQ Remote API
+
+# modo frota: Drone1..DroneN no OPC UA e "/Quadcopter[i]/base", "/target[i]"
+# (i = 0..N-1) na cena; as poses de todos ficam em arrays (N, 3)
+FROTA             = False
+FROTA_DRONE_PATH  = "/Quadcopter[{i}]/base"
+FROTA_TARGET_PATH = "/target[{i}]"
 
 # velocidade máx. do alvo (m/s) e passo de atualização
 TARGET_SPEED = 0.35
 DT           = 0.05         # 20 Hz
+DT_MAX       = 0.25         # maior passo de tempo aplicado após um atraso (s)
+OVERRUN_POLICY = "skip"     # "skip" ou "catchup" (ver agendador.py)
 POS_TOL      = 1e-4         # tolerância para “parado”
+TARGET_ACCEL = 0.5          # aceleração máx. do alvo no modo trajetória (m/s²)
+STATS_PERIOD = 5.0          # intervalo entre relatórios de tempo (s)
 
-############################
-# OPC UA helpers
-############################
-def connect_opc(url=OPCUA_URL):
-    client = Client(url)
-    client.connect()
-    print("[OPC] Connected")
+# acesso ao simulador: "direct" (3 req/tick), "cache" (2) ou "helper" (1)
+SIM_MODE     = "helper"
+SIM_STEPPING = False        # True: modo síncrono, um passo de simulação por tick
 
-    root = client.get_objects_node()
+# modo trajetória: a cada novo comando a ponte planeja o caminho até o
+# objetivo (perfil "trapezio" ou "minjerk"), amostrado a cada TRAJ_DT, e o
+# envia numa chamada; o script auxiliar o reproduz no tempo de simulação e
+# por tick só as poses são lidas. None: passos de TARGET_SPEED * DT por tick.
+TRAJ_PERFIL  = None
+TRAJ_DT      = 0.02         # intervalo entre amostras da trajetória (s)
 
-    # Tente achar a pasta "Drone" no ns=3 (padrão do SimulationServer),
-    # e tenha fallback para procurar por nome entre os filhos.
-    drone_folder = None
-    try:
-        drone_folder = root.get_child(["3:Drone"])
-    except Exception:
-        # fallback: varrer filhos e procurar "Drone"
-        for n in root.get_children():
-            try:
-                name = n.get_browse_name().Name
-                if name.lower() == "drone":
-                    drone_folder = n
-                    break
-            except Exception:
-                pass
-    if drone_folder is None:
-        raise RuntimeError("Não encontrei a pasta 'Drone' no servidor OPC UA.")
+# script auxiliar do modo "helper": escreve os targets e lê os drones numa
+# chamada (posições em listas planas x1, y1, z1, x2, ...)
+SIM_HELPER_LUA = """
+function bridge_tick(targets, drones, ps)
+    local out = {}
+    for i = 1, #targets do
+        sim.setObjectPosition(targets[i], -1, {ps[3*i-2], ps[3*i-1], ps[3*i]})
+        local p = sim.getObjectPosition(drones[i], -1)
+        out[3*i-2], out[3*i-1], out[3*i] = p[1], p[2], p[3]
+    end
+    return out
+end
 
-    # Mapeie variáveis por nome (case-insensitive)
-    name_to_node = {}
-    for v in drone_folder.get_children():
-        try:
-            nm = v.get_browse_name().Name
-            name_to_node[nm.lower()] = v
-        except Exception:
-            pass
+-- modo trajetória: amostras (K, N, 3) em lista plana, reproduzidas com
+-- interpolação linear a partir do tempo de simulação da chamada
+traj = nil
 
-    # Esperadas (ajuste aqui se seus nomes diferirem)
-    tX = name_to_node.get("targetx")
-    tY = name_to_node.get("targety")
-    tZ = name_to_node.get("targetz")
-    dX = name_to_node.get("dronex")
-    dY = name_to_node.get("droney")
-    dZ = name_to_node.get("dronez")
-
-    if not all([tX, tY, tZ, dX, dY, dZ]):
-        found = ", ".join(sorted(name_to_node.keys()))
-        raise RuntimeError(
-            "Variáveis esperadas não encontradas. "
-            "Quero TargetX, TargetY, TargetZ, DroneX, DroneY, DroneZ. "
-            f"Encontradas: {found}"
-        )
-
-    print("[OPC] Vars bound:",
-          "TargetX/TargetY/TargetZ & DroneX/DroneY/DroneZ")
-    return client, (tX, tY, tZ, dX, dY, dZ)
+function traj_aplicar(t)
+    local m = #traj.targets
+    local s = t / traj.dt
+    local k = math.min(math.floor(s), traj.n - 1)
+    local k1 = math.min(k + 1, traj.n - 1)
+    local f = math.min(s - k, 1)
+    for i = 1, m do
+        local a, b = 3 * (k * m + i - 1), 3 * (k1 * m + i - 1)
+        local p = {}
+        for j = 1, 3 do
+            p[j] = traj.ps[a+j] + f * (traj.ps[b+j] - traj.ps[a+j])
+        end
+        sim.setObjectPosition(traj.targets[i], -1, p)
+    end
+end
+
+function bridge_traj(targets, dt, n, ps)
+    traj = {targets = targets, dt = dt, n = n, ps = ps, t0 = sim.getSimulationTime()}
+    traj_aplicar(0)
+    return n
+end
+
+function sysCall_actuation()
+    if traj then
+        local t = sim.getSimulationTime() - traj.t0
+        traj_aplicar(t)
+        if t >= (traj.n - 1) * traj.dt then
+            traj = nil
+        end
+    end
+end
+
+function bridge_poses(targets, drones)
+    local out = {}
+    for _, h in ipairs(drones) do
+        for _, c in ipairs(sim.getObjectPosition(h, -1)) do out[#out+1] = c end
+    end
+    for _, h in ipairs(targets) do
+        for _, c in ipairs(sim.getObjectPosition(h, -1)) do out[#out+1] = c end
+    end
+    out[#out+1] = traj and (sim.getSimulationTime() - traj.t0) or -1
+    return out
+end
+"""
 
 ############################
 # Coppelia helpers
 ############################
-def connect_coppelia():
-    client = RemoteAPIClient()   # 127.0.0.1:23000
+def connect_coppelia(n=1):
+    client = RemoteAPIClient(SIM_HOST, SIM_PORT)
     sim = client.getObject('sim')
 
     # garanta sim parada e inicie
@@ -84,13 +114,20 @@ def connect_coppelia():
         sim.stopSimulation()
         while sim.getSimulationState() != sim.simulation_stopped:
             time.sleep(0.1)
+    if SIM_STEPPING:
+        # a simulação só avança quando a ponte chama step() a cada tick
+        client.setStepping(True)
     sim.startSimulation()
     time.sleep(0.5)
 
-    drone  = sim.getObject(DRONE_PATH)
-    target = sim.getObject(TARGET_PATH)
-    print("[SIM] Connected; handles ok")
-    return sim, drone, target
+    if FROTA:
+        drones  = [sim.getObject(FROTA_DRONE_PATH.format(i=i)) for i in range(n)]
+        targets = [sim.getObject(FROTA_TARGET_PATH.format(i=i)) for i in range(n)]
+    else:
+        drones  = [sim.getObject(DRONE_PATH)]
+        targets = [sim.getObject(TARGET_PATH)]
+    print(f"[SIM] Connected; handles ok ({len(drones)} drone(s))")
+    return client, sim, drones, targets
 
 def get_pos(sim, handle):
     return sim.getObjectPosition(handle, -1)  # world
@@ -98,73 +135,293 @@ def get_pos(sim, handle):
 def set_pos(sim, handle, p):
     sim.setObjectPosition(handle, -1, list(p))
 
+def install_helper(client, sim, target):
+    """Instala no CoppeliaSim o script auxiliar e devolve suas funções."""
+    try:
+        # CoppeliaSim >= 4.8
+        script = sim.createScript(sim.scripttype_customization, SIM_HELPER_LUA)
+    except Exception:
+        script = sim.addScript(sim.scripttype_customizationscript)
+        sim.setScriptStringParam(script, sim.scriptstringparam_text, SIM_HELPER_LUA)
+        sim.associateScriptWithObject(script, target)
+    return script, client.getScriptFunctions(script)
+
+class SimLink:
+    """Acesso aos targets e drones com o mínimo de requisições ZMQ por tick.
+
+    Modos (SIM_MODE), para N drones:
+      "direct" – lê os targets, escreve os targets e lê os drones (3N requisições);
+      "cache"  – a ponte é a única que move os targets, então a posição deles
+                 fica guardada localmente (2N requisições);
+      "helper" – um script no simulador escreve os targets e devolve a pose
+                 dos drones numa única chamada (1 requisição).
+    """
+
+    def __init__(self, client, sim, drones, targets, mode=SIM_MODE):
+        self.client = client
+        self.sim = sim
+        self.drones = drones
+        self.targets = targets
+        self.script = None
+        self.helper = None
+        self.p_target = None
+        self.traj = None
+        self.traj_dt = TRAJ_DT
+        self.traj_t0 = 0.0
+        self.mode = mode
+        if mode == "helper":
+            try:
+                self.script, self.helper = install_helper(client, sim, targets[0])
+                self.helper.bridge_tick(targets, drones, self.read_target().ravel().tolist())
+            except Exception as e:
+                print(f"[SIM] Script auxiliar indisponível ({e}). Usando modo 'cache'.")
+                self.remove_helper()
+                mode = "cache"
+        self.mode = mode
+        print(f"[SIM] Modo de acesso: {self.mode}")
+
+    def read_target(self):
+        if self.mode == "direct" or self.p_target is None:
+            self.p_target = np.array([get_pos(self.sim, t) for t in self.targets], dtype=float)
+        return self.p_target
+
+    def read_drone(self):
+        return np.array([get_pos(self.sim, d) for d in self.drones], dtype=float)
+
+    def resync(self):
+        """Relê o target do simulador (caso tenha sido movido pela interface)."""
+        self.p_target = None
+
+    def tick(self, p_next):
+        """Move os targets para p_next (N, 3) e devolve a pose atual dos drones."""
+        p_next = np.asarray(p_next, dtype=float)
+        if SIM_STEPPING:
+            self.client.step()
+        if self.helper is not None:
+            p_drone = self.helper.bridge_tick(self.targets, self.drones, p_next.ravel().tolist())
+            p_drone = np.reshape(p_drone, (-1, 3))
+        else:
+            for target, p in zip(self.targets, p_next.tolist()):
+                set_pos(self.sim, target, p)
+            p_drone = self.read_drone()
+        self.p_target = p_next
+        return p_drone
+
+    def send_trajectory(self, amostras, dt):
+        """Envia a trajetória (K, N, 3) dos targets; com o script auxiliar ela
+        é reproduzida no simulador, senão a ponte a reproduz em read_poses()."""
+        if self.helper is not None:
+            self.helper.bridge_traj(self.targets, dt, len(amostras), amostras.ravel().tolist())
+        self.traj, self.traj_dt, self.traj_t0 = amostras, dt, time.perf_counter()
+
+    def read_poses(self):
+        """Modo trajetória: poses dos drones e dos targets (N, 3) e o tempo
+        desde o início da trajetória em andamento (-1 se não há nenhuma)."""
+        if self.helper is not None:
+            if SIM_STEPPING:
+                self.client.step()
+            n = len(self.drones)
+            r = np.asarray(self.helper.bridge_poses(self.targets, self.drones), dtype=float)
+            return r[:3 * n].reshape(-1, 3), r[3 * n:6 * n].reshape(-1, 3), r[-1]
+        if self.traj is None:
+            return self.tick(self.read_target()), self.p_target, -1.0
+        t = time.perf_counter() - self.traj_t0
+        p_drone = self.tick(sample_trajectory(self.traj, self.traj_dt, t))
+        if t >= (len(self.traj) - 1) * self.traj_dt:
+            self.traj, t = None, -1.0
+        return p_drone, self.p_target, t
+
+    def remove_helper(self):
+        if self.script is None:
+            return
+        try:
+            self.sim.removeScript(self.script)
+        except Exception:
+            try:
+                self.sim.removeObjects([self.script])
+            except Exception:
+                pass
+        self.script = None
+        self.helper = None
+
 def step_towards(p_now, p_goal, vmax, dt):
-    """Dá um passo de p_now -> p_goal, respetando velocidade máxima."""
-    dx = [p_goal[i] - p_now[i] for i in range(3)]
-    dist = math.dist(p_now, p_goal)
-    if dist <= POS_TOL:
-        return p_goal
+    """Dá um passo de p_now -> p_goal para todos os drones (linhas de um array
+    (N, 3)) numa só operação, respeitando a velocidade máxima."""
+    d = p_goal - p_now
+    dist = np.linalg.norm(d, axis=-1, keepdims=True)
     max_step = vmax * dt
-    if dist <= max_step:
-        return p_goal
-    s = max_step / dist
-    return [p_now[i] + s * dx[i] for i in range(3)]
+    # parados (dist <= POS_TOL) ou a menos de um passo vão direto ao comando
+    longe = dist > max(max_step, POS_TOL)
+    return np.where(longe, p_now + d * (max_step / np.where(longe, dist, 1.0)), p_goal)
+
+# matriz das condições finais (posição, velocidade e aceleração em tau = 1)
+# para os coeficientes c3, c4, c5 do polinômio de quinto grau (minjerk)
+MINJERK_INV = np.linalg.inv(np.array([[1, 1, 1], [3, 4, 5], [6, 12, 20]], dtype=float))
+
+def plan_trajectory(p0, p1, v0, vmax, amax, dt, perfil="minjerk"):
+    """Amostra a cada dt o caminho dos targets de p0 até p1 (arrays (N, 3)) e
+    devolve um array (K, N, 3) que termina em p1.
+
+    "minjerk" parte da velocidade v0 (N, 3) e chega com velocidade e
+    aceleração nulas; "trapezio" anda em linha reta partindo do repouso. A
+    duração de cada drone respeita vmax e amax; o mais longo define K."""
+    d = p1 - p0
+    dist = np.linalg.norm(d, axis=-1)
+    if perfil == "trapezio":
+        ta = np.minimum(vmax / amax, np.sqrt(dist / amax))
+        vp = amax * ta
+        tc = np.divide(dist - vp * ta, vp, out=np.zeros_like(dist), where=vp > 0)
+        dur = 2 * ta + tc
+    else:
+        # pico de velocidade 1.875 d / T e de aceleração 5.77 d / T²
+        dur = np.maximum(1.875 * dist / vmax, np.sqrt(5.7735 * dist / amax))
+    dur = np.maximum(dur, dt)
+    if perfil == "trapezio":
+        t = np.minimum(np.arange(int(np.ceil(dur.max() / dt)) + 1)[:, None] * dt, dur)
+        s = np.where(t < ta, 0.5 * amax * t**2,
+                     np.where(t < ta + tc, 0.5 * vp * ta + vp * (t - ta),
+                              dist - 0.5 * amax * (dur - t)**2))
+        frac = np.divide(s, dist, out=np.ones_like(s), where=dist > 0)
+        return p0 + frac[..., None] * d
+    for _ in range(3):
+        t = np.minimum(np.arange(int(np.ceil(dur.max() / dt)) + 1)[:, None] * dt, dur)
+        tau = (t / dur)[..., None]                           # (K, N, 1)
+        c1 = v0 * dur[:, None]
+        c3, c4, c5 = np.einsum("ij,jnk->ink", MINJERK_INV, np.stack([d - c1, -c1, np.zeros_like(d)]))
+        amostras = p0 + tau * (c1 + tau**2 * (c3 + tau * (c4 + tau * c5)))
+        # partindo com velocidade o pico pode passar de vmax: alonga e refaz
+        v = np.linalg.norm(np.diff(amostras, axis=0), axis=-1).max(axis=0, initial=0) / dt
+        if np.all(v <= vmax * 1.01):
+            break
+        dur = dur * np.maximum(v / vmax, 1.0)
+    return amostras
+
+def sample_trajectory(amostras, dt, t):
+    """Posição (N, 3) no instante t, com interpolação linear entre amostras."""
+    s = max(t, 0.0) / dt
+    k = min(int(s), len(amostras) - 1)
+    k1 = min(k + 1, len(amostras) - 1)
+    return amostras[k] + min(s - k, 1.0) * (amostras[k1] - amostras[k])
+
+def trajectory_velocity(amostras, dt, t):
+    """Velocidade (N, 3) da trajetória no instante t (zero fora dela)."""
+    k = int(t / dt)
+    if t < 0 or k >= len(amostras) - 1:
+        return np.zeros(amostras.shape[1:])
+    return (amostras[k + 1] - amostras[k]) / dt
 
 ############################
 # Main
 ############################
 def main():
     # 1) Conectar
-    opc_client, (tX, tY, tZ, dX, dY, dZ) = connect_opc()
-    sim, drone, target = connect_coppelia()
+    # o laço lê o Prosys a cada tick, então não precisa de keep-alive à parte
+    sessao = SessaoOPC(OPCUA_URL, keepalive=0, ligar=lambda c: vincular_drones(c, OPCUA_URL, FROTA))
+    opc_client, (pastas, nos_target, nos_drone) = sessao.conectar()
+    n = len(pastas)
+    client, sim, drones, targets = connect_coppelia(n)
+    link = SimLink(client, sim, drones, targets)
+
+    def reconectar(erro):
+        # reconecta com backoff; o agendador pula os ticks perdidos
+        sessao.falhou(erro)
+        cliente, (pastas, alvos, poses) = sessao.conectar()
+        if len(pastas) != n:
+            raise RuntimeError(f"A frota mudou de {n} para {len(pastas)} drones; reinicie a ponte.")
+        return cliente, alvos, poses
 
     try:
         # 2) Inicial: mantenha alvo na altura mínima (decola suave)
-        p_drone = get_pos(sim, drone)
-        p_target = get_pos(sim, target)
-        alt = max(p_drone[2], 1.2)
-        p_target = [p_target[0], p_target[1], alt]
-        set_pos(sim, target, p_target)
+        p_drone = link.read_drone()
+        p_target = link.read_target().copy()
+        p_target[:, 2] = np.maximum(p_drone[:, 2], 1.2)
+        link.tick(p_target)
 
         # 3) loop
         print("[RUN] Control loop started. Press Ctrl+C to stop.")
+        objetivo, traj = None, None
+        t_opc_soma, t_opc_max, n_ticks = 0.0, 0.0, 0
+        t_sim_soma, t_sim_max = 0.0, 0.0
+        t_relatorio = time.perf_counter() + STATS_PERIOD
+        sched = FixedRateScheduler(DT, OVERRUN_POLICY)
         while True:
-            # 3.1) ler comandos do Prosys
+            # 3.0) esperar o próximo prazo; dt é o tempo a integrar (ver agendador.py)
+            dt = min(sched.wait(), DT_MAX)
+
+            # 3.1) ler comandos do Prosys (TargetX/Y/Z da frota num único Read)
+            t0 = time.perf_counter()
             try:
-                cmd = [float(tX.get_value()), float(tY.get_value()), float(tZ.get_value())]
+                cmd = np.reshape(opc_client.get_values(nos_target), (-1, 3)).astype(float)
             except Exception as e:
-                print("[OPC] read error:", e)
-                time.sleep(DT)
+                opc_client, nos_target, nos_drone = reconectar(e)
                 continue
+            t_opc = time.perf_counter() - t0
 
-            # 3.2) avançar o target suavemente até o comando
-            p_target = get_pos(sim, target)
-            p_next   = step_towards(p_target, cmd, TARGET_SPEED, DT)
-            set_pos(sim, target, p_next)
+            # 3.2) avançar os targets suavemente até o comando e ler os drones
+            t0 = time.perf_counter()
+            if TRAJ_PERFIL:
+                # só as poses por tick; um novo comando gera uma nova trajetória,
+                # que parte da posição e velocidade atuais dos targets
+                p_drone, p_target, t_traj = link.read_poses()
+                if objetivo is None or np.any(np.abs(cmd - objetivo) > POS_TOL):
+                    v0 = trajectory_velocity(traj, TRAJ_DT, t_traj) if traj is not None else 0 * cmd
+                    traj = plan_trajectory(p_target, cmd, v0, TARGET_SPEED, TARGET_ACCEL,
+                                           TRAJ_DT, TRAJ_PERFIL)
+                    link.send_trajectory(traj, TRAJ_DT)
+                    objetivo = cmd
+            else:
+                p_target = link.read_target()
+                p_next   = step_towards(p_target, cmd, TARGET_SPEED, dt)
+                p_drone  = link.tick(p_next)
+            t_sim = time.perf_counter() - t0
 
-            # 3.3) publicar pose do drone no Prosys
-            p_drone = get_pos(sim, drone)
+            # 3.3) publicar pose dos drones no Prosys (DroneX/Y/Z num único Write)
+            t0 = time.perf_counter()
             try:
-                dX.set_value(p_drone[0])
-                dY.set_value(p_drone[1])
-                dZ.set_value(p_drone[2])
+                opc_client.set_values(nos_drone, p_drone.ravel().tolist())
             except Exception as e:
-                print("[OPC] write error:", e)
+                opc_client, nos_target, nos_drone = reconectar(e)
+            t_opc += time.perf_counter() - t0
 
-            time.sleep(DT)
+            # 3.4) tempo gasto em OPC UA e no simulador por tick
+            t_opc_soma += t_opc
+            t_opc_max = max(t_opc_max, t_opc)
+            t_sim_soma += t_sim
+            t_sim_max = max(t_sim_max, t_sim)
+            n_ticks += 1
+            if time.perf_counter() >= t_relatorio:
+                st = sched.stats()
+                print(f"[STAT] OPC/tick: média {1e3 * t_opc_soma / n_ticks:.2f} ms, "
+                      f"máx {1e3 * t_opc_max:.2f} ms | "
+                      f"SIM/tick: média {1e3 * t_sim_soma / n_ticks:.2f} ms, "
+                      f"máx {1e3 * t_sim_max:.2f} ms ({n_ticks} ticks)")
+                print(f"[STAT] Período: média {1e3 * st['period_mean']:.2f} ms, "
+                      f"jitter RMS {1e3 * st['jitter_rms']:.2f} ms, "
+                      f"máx {1e3 * st['jitter_max']:.2f} ms | "
+                      f"overruns {st['overruns']}, pulados {st['skipped']}")
+                rc = sessao.estatisticas()
+                if rc["quedas"]:
+                    print(f"[STAT] OPC: quedas {rc['quedas']}, reconexões {rc['reconexoes']}, "
+                          f"fora do ar {rc['tempo_fora']:.3f} s (maior {rc['maior_queda']:.3f} s)")
+                sched.reset_stats()
+                t_opc_soma, t_opc_max, n_ticks = 0.0, 0.0, 0
+                t_sim_soma, t_sim_max = 0.0, 0.0
+                t_relatorio = time.perf_counter() + STATS_PERIOD
+                link.resync()
 
     except KeyboardInterrupt:
         print("\n[RUN] Stopping...")
     finally:
+        link.remove_helper()
         try:
             sim.stopSimulation()
         except Exception:
             pass
-        try:
-            opc_client.disconnect()
-        except Exception:
-            pass
+        sessao.fechar()
         print("[CLEAN] Done.")
 
 if __name__ == "__main__":
+    # python brigde.py [dt]  (ex.: 0.005 contra o sim_headless.py)
+    if len(sys.argv) > 1:
+        DT = float(sys.argv[1])
     main()
@@ -1,13 +1,20 @@
-import socket
 import datetime
+import os
 import re
+from protocolo_clp import ClienteCLP
+from historiador_bin import HistorianStore, parse_xyz
+from escritor_log import obter_escritor
 
 CLP_HOST = "localhost"
 CLP_PORT = 65432
 FILENAME = "historiador.txt"
 
-# Padrão "float,float,float" sem espaços.
-PADRAO_COORDENADAS = re.compile(r"^-?\d+(\.\d+)?,-?\d+(\.\d+)?,-?\d+(\.\d+)?$")
+# Historiador binário indexado (consultas por intervalo de tempo).
+# Vários terminais podem rodar juntos: a origem leva o PID de cada um.
+hist_bin = HistorianStore(f"cliente-{os.getpid()}")
+
+# Padrão "float,float,float" sem espaços, com prefixo "n:" opcional (drone n).
+PADRAO_COORDENADAS = re.compile(r"^(\d+:)?-?\d+(\.\d+)?,-?\d+(\.\d+)?,-?\d+(\.\d+)?$")
 
 def historian(sent_target, received_pos):
     # Registra as informações no arquivo historico.txt
@@ -15,20 +22,22 @@ def historian(sent_target, received_pos):
     timestamp = datetime.datetime.now().isoformat()
     linha = f"[{timestamp}] - Target Enviado: <{sent_target}> | Posicao Recebida: <{received_pos}>\n"
     
-    try:
-        # Abre o arquivo em modo "append" (a) para adicionar no final
-        with open(FILENAME, "a", encoding="utf-8") as f:
-            f.write(linha)
-    except Exception as e:
-        print(f"[Erro Historiador] Falha ao escrever no arquivo: {e}")
+    # A gravação em disco é feita em lote por uma thread de fundo
+    if not obter_escritor(FILENAME).escrever(linha):
+        print("[Erro Historiador] Fila de gravação cheia; registro descartado.")
+
+    hist_bin.append(parse_xyz(sent_target.rpartition(":")[2]), parse_xyz(received_pos))
 
 def main():
     print("--- Cliente TCP/IP ---")
     print("Digite as coordenadas de target no formato 'x,y,z' (ex: 1.5,2.0,1.0)")
+    print("Para outro drone, use 'n:x,y,z' (ex: 1:0.5,0.5,1.0)")
     print("Digite 'sair' para fechar.")
 
+    clp = ClienteCLP(CLP_HOST, CLP_PORT, timeout=5.0)
+
     while True:
-        target_str = input("\nNovo Target (x,y,z): ")
+        target_str = input("\nNovo Target ([n:]x,y,z): ")
         
         if target_str.lower() == 'sair':
             break
@@ -36,27 +45,19 @@ def main():
         # --- Validação ---
         # Verifica se a string bate com o padrão "n,n,n" antes de enviar
         if not PADRAO_COORDENADAS.match(target_str):
-            print(f"  [Erro] Formato inválido. Use 'x,y,z' sem espaços.")
+            print(f"  [Erro] Formato inválido. Use 'x,y,z' ou 'n:x,y,z' sem espaços.")
             continue
         
         # --- Comunicação TCP ---
         try:
-            # Cria um novo socket para cada transação, pois o CLP.py desconecta após cada comando
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((CLP_HOST, CLP_PORT))
-                
-                # Envia novo target
-                s.sendall(target_str.encode('utf-8'))
-                
-                # Recebe posição atual
-                data = s.recv(1024)
-                pos_drone_str = data.decode('utf-8')
-                
-                print(f"  > Target enviado: {target_str}")
-                print(f"  < Posicao atual recebida: {pos_drone_str}")
-                
-                # Log no historiador
-                historian(target_str, pos_drone_str)
+            # A conexão com o CLP é mantida aberta entre os comandos
+            pos_drone_str = clp.enviar(target_str)
+
+            print(f"  > Target enviado: {target_str}")
+            print(f"  < Posicao atual recebida: {pos_drone_str}")
+
+            # Log no historiador
+            historian(target_str, pos_drone_str)
 
         except ConnectionRefusedError:
             print(f"  [Erro TCP] Não foi possível conectar.")
@@ -64,5 +65,7 @@ def main():
             print(f"  [Erro TCP] Falha na comunicação com o CLP: {e}")
             historian(target_str, f"ERRO NA COMUNICACAO: {e}")
 
+    clp.fechar()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,342 @@
+import os
+import re
+import gzip
+import lzma
+import mmap
+import time
+import queue
+import shutil
+import atexit
+import weakref
+import datetime
+import threading
+import contextlib
+
+############################
+# Escritor de log em lote
+############################
+# Quem gera registros (historiador, IHM, MES) só coloca a linha numa fila
+# limitada e volta imediatamente; uma thread de fundo esvazia a fila a cada
+# FLUSH_INTERVALO e grava o lote inteiro de uma vez. Se a fila estiver
+# cheia o registro é descartado e contado em `descartados` (contador de
+# back-pressure): o chamador nunca espera pelo disco.
+#
+# Política de fsync:
+#   "nunca"     – só flush para o sistema operacional;
+#   "lote"      – fsync depois de cada lote gravado;
+#   "periodico" – fsync no máximo a cada FSYNC_PERIODO segundos.
+#
+# Rotação: antes de cada lote o arquivo ativo é renomeado para
+# "<arquivo>.<AAAAMMDD-HHMMSS-ffffff>" quando passa de ROTACAO_BYTES
+# ("tamanho") ou quando foi escrito pela última vez em outro dia ("diaria").
+# Os segmentos fechados são comprimidos (gzip ou lzma) em segundo plano.
+# Se o renome falhar (no Windows, quando outro processo mantém o mesmo log
+# aberto) a rotação é adiada e tentada de novo a cada lote; passados
+# ROTACAO_ADIAMENTO_MAX segundos, o arquivo é copiado para o segmento e
+# truncado, com um aviso, para que não cresça sem limite.
+# Os leitores usam listar_segmentos()/abrir_segmento()/iter_linhas() e
+# enxergam segmentos rotacionados, comprimidos e o arquivo ativo como um
+# único fluxo, do mais antigo para o mais novo.
+
+FLUSH_INTERVALO = 0.5       # s
+FSYNC_POLITICA = "nunca"
+FSYNC_PERIODO = 5.0         # s
+FILA_MAX = 10000            # registros
+ROTACAO = "tamanho"         # "nenhuma", "tamanho" ou "diaria"
+ROTACAO_BYTES = 4 * 1024 * 1024
+COMPRESSAO = "gzip"         # None, "gzip" ou "lzma"
+ROTACAO_ADIAMENTO_MAX = 60.0  # s que uma rotação pode ficar adiada antes da cópia
+
+POLITICAS_FSYNC = ("nunca", "lote", "periodico")
+POLITICAS_ROTACAO = ("nenhuma", "tamanho", "diaria")
+EXTENSOES = {"gzip": ".gz", "lzma": ".xz"}
+ABRIR_COMPRIMIDO = {".gz": gzip.open, ".xz": lzma.open}
+PADRAO_CARIMBO = re.compile(r"^\d{8}-\d{6}-\d{6}$")
+
+
+class EscritorLog:
+    """Fila limitada + thread de fundo que grava os registros em lote."""
+
+    def __init__(self, caminho, intervalo=FLUSH_INTERVALO, fsync=FSYNC_POLITICA, tam_fila=FILA_MAX,
+                 rotacao=ROTACAO, tam_max=ROTACAO_BYTES, compressao=COMPRESSAO):
+        if fsync not in POLITICAS_FSYNC:
+            raise ValueError(f"Política de fsync desconhecida: {fsync}")
+        if rotacao not in POLITICAS_ROTACAO:
+            raise ValueError(f"Política de rotação desconhecida: {rotacao}")
+        if compressao is not None and compressao not in EXTENSOES:
+            raise ValueError(f"Compressão desconhecida: {compressao}")
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.fsync = fsync
+        self.rotacao = rotacao
+        self.tam_max = tam_max
+        self.compressao = compressao
+        self.rotacoes = 0
+        self.descartados = 0
+        self.gravados = 0
+        self.lotes = 0
+        self.erros = 0
+        self._f = None
+        self._adiada_desde = None
+        self._ultimo_fsync = time.monotonic()
+        self._fila = queue.Queue(tam_fila)
+        self._lock_contador = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name=f"escritor:{caminho}", daemon=True)
+        self._thread.start()
+        _ativos.add(self)
+
+    def escrever(self, registro):
+        """Enfileira um registro sem bloquear; devolve False se foi descartado."""
+        try:
+            self._fila.put_nowait(registro)
+            return True
+        except queue.Full:
+            with self._lock_contador:
+                self.descartados += 1
+            return False
+
+    def estatisticas(self):
+        return {
+            "pendentes": self._fila.qsize(),
+            "gravados": self.gravados,
+            "lotes": self.lotes,
+            "descartados": self.descartados,
+            "erros": self.erros,
+            "rotacoes": self.rotacoes,
+        }
+
+    def fechar(self, timeout=5.0):
+        """Grava o que ainda estiver na fila e encerra a thread."""
+        self._parar.set()
+        self._thread.join(timeout)
+
+    # --- thread de fundo ---
+
+    def _executar(self):
+        self._comprimir_pendentes()
+        while not self._parar.wait(self.intervalo):
+            self._descarregar()
+        self._descarregar()
+        self._fechar_arquivo()
+
+    def _descarregar(self):
+        lote = []
+        while True:
+            try:
+                lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        if not lote:
+            return
+        try:
+            self._gravar(lote)
+            self._f.flush()
+            agora = time.monotonic()
+            if self.fsync == "lote" or (
+                self.fsync == "periodico" and agora - self._ultimo_fsync >= FSYNC_PERIODO
+            ):
+                os.fsync(self._f.fileno())
+                self._ultimo_fsync = agora
+            self.gravados += len(lote)
+            self.lotes += 1
+        except Exception as e:
+            self.erros += len(lote)
+            print(f"[Escritor] Falha ao gravar {len(lote)} registros em {self.caminho}: {e}")
+            self._fechar_arquivo()
+
+    def _gravar(self, lote):
+        dados = "".join(lote).encode("utf-8")
+        self._verificar_rotacao(len(dados))
+        if self._f is None:
+            self._f = open(self.caminho, "ab")
+        self._f.write(dados)
+
+    def _verificar_rotacao(self, n_novos):
+        # outro processo pode ter rotacionado o arquivo que mantemos aberto
+        if self._f is not None:
+            try:
+                mesmo = os.fstat(self._f.fileno()).st_ino == os.stat(self.caminho).st_ino
+            except OSError:
+                mesmo = False
+            if not mesmo:
+                self._fechar_arquivo()
+        if self.rotacao == "nenhuma":
+            return
+        try:
+            st = os.stat(self.caminho)
+        except FileNotFoundError:
+            return
+        if st.st_size == 0:
+            return
+        if self.rotacao == "tamanho":
+            rodar = st.st_size + n_novos > self.tam_max
+        else:
+            rodar = datetime.date.fromtimestamp(st.st_mtime) != datetime.date.today()
+        if rodar:
+            self._rotacionar()
+
+    def _rotacionar(self):
+        self._fechar_arquivo()
+        destino = f"{self.caminho}.{datetime.datetime.now():%Y%m%d-%H%M%S-%f}"
+        try:
+            os.rename(self.caminho, destino)
+        except OSError as e:
+            # ex.: no Windows o arquivo aberto por outro processo não pode ser renomeado
+            agora = time.monotonic()
+            if self._adiada_desde is None:
+                self._adiada_desde = agora
+                print(f"[Escritor] Rotação de {self.caminho} adiada: {e}")
+            if agora - self._adiada_desde < ROTACAO_ADIAMENTO_MAX:
+                return
+            print(f"[Escritor] Rotação de {self.caminho} adiada há mais de {ROTACAO_ADIAMENTO_MAX:.0f} s; "
+                  f"copiando para {destino} e truncando (linhas gravadas por outro processo "
+                  f"durante a cópia podem se perder).")
+            if not self._copiar_e_truncar(destino):
+                return
+        self._adiada_desde = None
+        self.rotacoes += 1
+        print(f"[Escritor] {self.caminho} rotacionado para {destino}")
+        self._comprimir_em_fundo(destino)
+
+    def _copiar_e_truncar(self, destino):
+        temporario = destino + ".part"   # invisível para listar_segmentos até o replace
+        try:
+            shutil.copyfile(self.caminho, temporario)
+            os.replace(temporario, destino)
+            with open(self.caminho, "r+b") as f:
+                f.truncate(0)
+            return True
+        except OSError as e:
+            print(f"[Escritor] Falha ao rotacionar {self.caminho} por cópia: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(temporario)
+            return False
+
+    def _comprimir_em_fundo(self, segmento):
+        if self.compressao is None:
+            return
+        threading.Thread(target=comprimir_segmento, args=(segmento, self.compressao), daemon=True).start()
+
+    def _comprimir_pendentes(self):
+        # segmentos que ficaram sem comprimir (ex.: processo encerrado no meio)
+        if self.compressao is None:
+            return
+        for segmento in listar_segmentos(self.caminho, incluir_ativo=False):
+            if os.path.splitext(segmento)[1] not in ABRIR_COMPRIMIDO:
+                self._comprimir_em_fundo(segmento)
+
+    def _fechar_arquivo(self):
+        if self._f is not None:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f = None
+
+
+def comprimir_segmento(segmento, compressao=COMPRESSAO):
+    """Comprime um segmento fechado; o original só é removido depois que o
+    comprimido está completo, então um leitor nunca vê um arquivo pela metade."""
+    destino = segmento + EXTENSOES[compressao]
+    temporario = destino + ".part"
+    abrir = gzip.open if compressao == "gzip" else lzma.open
+    try:
+        with open(segmento, "rb") as origem, abrir(temporario, "wb") as saida:
+            shutil.copyfileobj(origem, saida, 1024 * 1024)
+        os.replace(temporario, destino)
+        os.remove(segmento)
+    except OSError as e:
+        print(f"[Escritor] Falha ao comprimir {segmento}: {e}")
+        with contextlib.suppress(OSError):
+            os.remove(temporario)
+
+
+def listar_segmentos(caminho, incluir_ativo=True):
+    """Segmentos rotacionados de `caminho` (mais antigos primeiro) e o arquivo ativo."""
+    pasta = os.path.dirname(caminho) or "."
+    prefixo = os.path.basename(caminho) + "."
+    achados = {}
+    try:
+        nomes = os.listdir(pasta)
+    except FileNotFoundError:
+        nomes = []
+    for nome in nomes:
+        if not nome.startswith(prefixo):
+            continue
+        carimbo, ext = os.path.splitext(nome[len(prefixo):])
+        if ext and ext not in ABRIR_COMPRIMIDO:
+            carimbo = carimbo + ext  # sem extensão de compressão
+            ext = ""
+        if not PADRAO_CARIMBO.match(carimbo):
+            continue
+        # durante a compressão existem as duas versões: vale a original
+        if carimbo in achados and ext:
+            continue
+        achados[carimbo] = os.path.join(pasta, nome)
+    segmentos = [achados[c] for c in sorted(achados)]
+    if incluir_ativo and os.path.exists(caminho):
+        segmentos.append(caminho)
+    return segmentos
+
+
+def fim_segmento(segmento):
+    """Instante da rotação de um segmento fechado (limite superior dos seus
+    registros); None para o arquivo ativo."""
+    nome = os.path.basename(segmento)
+    base, ext = os.path.splitext(nome)
+    if ext in ABRIR_COMPRIMIDO:
+        nome = base
+    carimbo = nome.rpartition(".")[2]
+    if not PADRAO_CARIMBO.match(carimbo):
+        return None
+    return datetime.datetime.strptime(carimbo, "%Y%m%d-%H%M%S-%f")
+
+
+@contextlib.contextmanager
+def abrir_segmento(segmento):
+    """Conteúdo de um segmento como buffer: mmap se plano, bytes se comprimido."""
+    ext = os.path.splitext(segmento)[1]
+    if ext in ABRIR_COMPRIMIDO:
+        with ABRIR_COMPRIMIDO[ext](segmento, "rb") as f:
+            yield f.read()
+        return
+    with open(segmento, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield buf
+
+
+def iter_linhas(caminho, encoding="utf-8"):
+    """Todas as linhas do log, atravessando segmentos rotacionados e comprimidos."""
+    for segmento in listar_segmentos(caminho):
+        ext = os.path.splitext(segmento)[1]
+        abrir = ABRIR_COMPRIMIDO.get(ext, open)
+        with abrir(segmento, "rt", encoding=encoding, errors="replace") as f:
+            yield from f
+
+
+_ativos = weakref.WeakSet()
+_escritores = {}
+_lock_escritores = threading.Lock()
+
+
+def obter_escritor(caminho, **opcoes):
+    """Escritor compartilhado por todos os módulos do processo para um mesmo arquivo."""
+    chave = os.path.abspath(caminho)
+    with _lock_escritores:
+        escritor = _escritores.get(chave)
+        if escritor is None:
+            escritor = EscritorLog(caminho, **opcoes)
+            _escritores[chave] = escritor
+        return escritor
+
+
+@atexit.register
+def fechar_todos():
+    with _lock_escritores:
+        _escritores.clear()
+    for escritor in list(_ativos):
+        escritor.fechar()
@@ -0,0 +1,251 @@
+import os
+import re
+import sys
+import threading
+import numpy as np
+from escritor_log import listar_segmentos, abrir_segmento, fim_segmento
+
+############################
+# Leitura e exportação dos logs de texto
+############################
+# Um único parser para os três formatos de linha existentes:
+#
+#   clienteTCPIP: [ts] - Target Enviado: <x,y,z> | Posicao Recebida: <x,y,z>
+#   IHM:          [ts] Target <x,y,z> → CLP <x,y,z>
+#   MES:          [ts] - X=x, Y=y, Z=z
+#
+# O arquivo é mapeado em memória e percorrido com uma única regex sobre
+# bytes; as linhas reconhecidas viram colunas NumPy em blocos de tamanho
+# fixo, então a memória usada além das colunas de saída é limitada. Linhas
+# de erro (posição que não é "x,y,z") ficam com a posição em NaN.
+# Segmentos rotacionados e comprimidos (escritor_log.py) são lidos em ordem,
+# antes do arquivo ativo, como se fossem um único arquivo.
+
+ARQUIVOS_PADRAO = ("historiador.txt", "mes.txt")
+TAM_BLOCO = 65536
+
+FONTE_CLIENTE = 0
+FONTE_IHM = 1
+FONTE_MES = 2
+
+COLUNAS = ("ts", "tx", "ty", "tz", "px", "py", "pz", "fonte")
+
+PADRAO_LINHA = re.compile(
+    rb"^\[([^\]\r\n]+)\] "
+    rb"(?:- Target Enviado: <([^>\r\n]*)> \| Posicao Recebida: <([^\r\n]*)>"
+    rb"|Target <([^>\r\n]*)> \xe2\x86\x92 CLP <([^>\r\n]*)>"
+    rb"|- X=([^,\r\n]+), Y=([^,\r\n]+), Z=([^\r\n]+))",
+    re.M,
+)
+
+NAN3 = (np.nan, np.nan, np.nan)
+
+
+def _xyz(texto):
+    try:
+        x, y, z = texto.rstrip(b">").split(b",")
+        return float(x), float(y), float(z)
+    except ValueError:
+        return NAN3
+
+
+def _bloco(ts, alvos, posicoes, fontes):
+    alvos = np.array(alvos, dtype=np.float64).reshape(-1, 3)
+    posicoes = np.array(posicoes, dtype=np.float64).reshape(-1, 3)
+    return {
+        "ts": np.array([t.decode("ascii") for t in ts], dtype="datetime64[us]"),
+        "tx": alvos[:, 0], "ty": alvos[:, 1], "tz": alvos[:, 2],
+        "px": posicoes[:, 0], "py": posicoes[:, 1], "pz": posicoes[:, 2],
+        "fonte": np.array(fontes, dtype=np.uint8),
+    }
+
+
+def iter_blocos_buffer(buf, tam_bloco=TAM_BLOCO):
+    """Percorre um buffer (bytes ou mmap) e produz blocos de colunas."""
+    ts, alvos, posicoes, fontes = [], [], [], []
+    for m in PADRAO_LINHA.finditer(buf):
+        g = m.groups()
+        if g[1] is not None:
+            alvo, pos, fonte = _xyz(g[1]), _xyz(g[2]), FONTE_CLIENTE
+        elif g[3] is not None:
+            alvo, pos, fonte = _xyz(g[3]), _xyz(g[4]), FONTE_IHM
+        else:
+            try:
+                pos = (float(g[5]), float(g[6]), float(g[7]))
+            except ValueError:
+                pos = NAN3
+            alvo, fonte = NAN3, FONTE_MES
+        ts.append(g[0])
+        alvos.extend(alvo)
+        posicoes.extend(pos)
+        fontes.append(fonte)
+        if len(ts) >= tam_bloco:
+            yield _bloco(ts, alvos, posicoes, fontes)
+            ts, alvos, posicoes, fontes = [], [], [], []
+    if ts:
+        yield _bloco(ts, alvos, posicoes, fontes)
+
+
+def _blocos_segmento(segmento, tam_bloco=TAM_BLOCO):
+    with abrir_segmento(segmento) as buf:
+        yield from iter_blocos_buffer(buf, tam_bloco)
+
+
+def iter_blocos(caminho, tam_bloco=TAM_BLOCO):
+    """Blocos de colunas de um log (todos os segmentos), lido via mmap."""
+    for segmento in listar_segmentos(caminho):
+        yield from _blocos_segmento(segmento, tam_bloco)
+
+
+def _vazio():
+    return _bloco([], [], [], [])
+
+
+def carregar(caminhos=ARQUIVOS_PADRAO):
+    """Lê os arquivos e devolve um dict de colunas ordenado por timestamp."""
+    blocos = [b for c in caminhos for b in iter_blocos(c)]
+    if not blocos:
+        return _vazio()
+    dados = {k: np.concatenate([b[k] for b in blocos]) for k in COLUNAS}
+    ordem = np.argsort(dados["ts"], kind="stable")
+    return {k: v[ordem] for k, v in dados.items()}
+
+
+############################
+# Consulta por intervalo (reprodução na IHM)
+############################
+# As colunas de cada segmento ficam em cache, indexadas pelo tamanho e
+# mtime do arquivo: segmentos fechados são lidos uma única vez e só o
+# arquivo ativo é relido quando muda. Segmentos fechados cujo intervalo
+# (entre a rotação anterior e a sua) não cruza o pedido nem são abertos.
+
+_cache_segmentos = {}
+_lock_cache = threading.Lock()
+
+
+def _colunas_segmento(segmento):
+    st = os.stat(segmento)
+    assinatura = (st.st_size, st.st_mtime_ns)
+    with _lock_cache:
+        item = _cache_segmentos.get(segmento)
+    if item is not None and item[0] == assinatura:
+        return item[1]
+    blocos = list(_blocos_segmento(segmento))
+    if blocos:
+        dados = {k: np.concatenate([b[k] for b in blocos]) for k in COLUNAS}
+        ordem = np.argsort(dados["ts"], kind="stable")
+        dados = {k: v[ordem] for k, v in dados.items()}
+    else:
+        dados = _vazio()
+    with _lock_cache:
+        _cache_segmentos[segmento] = (assinatura, dados)
+    return dados
+
+
+def carregar_intervalo(inicio=None, fim=None, caminhos=ARQUIVOS_PADRAO):
+    """Colunas com inicio <= ts <= fim (datetime64 ou texto ISO; None = aberto)."""
+    t0 = np.datetime64(inicio, "us") if inicio is not None else None
+    t1 = np.datetime64(fim, "us") if fim is not None else None
+    partes = []
+    for caminho in caminhos:
+        anterior = None
+        for segmento in listar_segmentos(caminho):
+            fim_seg = fim_segmento(segmento)
+            fim_seg = np.datetime64(fim_seg, "us") if fim_seg is not None else None
+            pular = (t0 is not None and fim_seg is not None and fim_seg < t0) or \
+                    (t1 is not None and anterior is not None and anterior > t1)
+            anterior = fim_seg
+            if pular:
+                continue
+            try:
+                dados = _colunas_segmento(segmento)
+            except FileNotFoundError:
+                continue  # rotacionado/comprimido enquanto líamos
+            ts = dados["ts"]
+            i = 0 if t0 is None else np.searchsorted(ts, t0, "left")
+            j = len(ts) if t1 is None else np.searchsorted(ts, t1, "right")
+            if j > i:
+                partes.append({k: v[i:j] for k, v in dados.items()})
+    if not partes:
+        return _vazio()
+    dados = {k: np.concatenate([p[k] for p in partes]) for k in COLUNAS}
+    ordem = np.argsort(dados["ts"], kind="stable")
+    return {k: v[ordem] for k, v in dados.items()}
+
+
+def lttb(x, y, n_saida):
+    """Índices escolhidos pelo Largest-Triangle-Three-Buckets (x crescente)."""
+    n = len(x)
+    if n_saida >= n or n_saida < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # primeiro e último pontos fixos; o miolo dividido em n_saida - 2 baldes
+    limites = np.linspace(1, n - 1, n_saida - 1).astype(np.int64)
+    escolhidos = np.empty(n_saida, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    a = 0
+    for k in range(n_saida - 2):
+        ini, fim = limites[k], limites[k + 1]
+        # vértice C: média do balde seguinte (ou o último ponto)
+        prox_fim = limites[k + 2] if k + 2 < len(limites) else n
+        prox_ini = fim if fim < prox_fim else n - 1
+        cx = x[prox_ini:prox_fim].mean()
+        cy = y[prox_ini:prox_fim].mean()
+        bx, by = x[ini:fim], y[ini:fim]
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = ini + int(np.argmax(area))
+        escolhidos[k + 1] = a
+    return escolhidos
+
+
+def trajetoria_reduzida(dados, n_pontos):
+    """Amostras de posição (sem erros) reduzidas a ~n_pontos por LTTB em x, y e z."""
+    ok = np.isfinite(dados["px"]) & np.isfinite(dados["py"]) & np.isfinite(dados["pz"])
+    dados = {k: v[ok] for k, v in dados.items()}
+    if len(dados["ts"]) <= n_pontos:
+        return dados
+    t = dados["ts"].astype("int64").astype(np.float64)
+    por_eixo = max(3, n_pontos // 3)
+    idx = np.unique(np.concatenate([lttb(t, dados[k], por_eixo) for k in ("px", "py", "pz")]))
+    return {k: v[idx] for k, v in dados.items()}
+
+
+def aquecer_cache(caminhos=ARQUIVOS_PADRAO):
+    """Lê todos os segmentos uma vez (ex.: numa thread ao iniciar a IHM)."""
+    carregar_intervalo(caminhos=caminhos)
+
+
+def exportar_npz(caminhos, destino):
+    dados = carregar(caminhos)
+    np.savez_compressed(destino, **dados)
+    return len(dados["ts"])
+
+
+def exportar_csv(caminhos, destino):
+    """Exporta bloco a bloco, sem montar as colunas inteiras em memória."""
+    n = 0
+    with open(destino, "w", encoding="utf-8") as f:
+        f.write(",".join(COLUNAS) + "\n")
+        for caminho in caminhos:
+            for b in iter_blocos(caminho):
+                ts = np.datetime_as_string(b["ts"], unit="us")
+                cols = [b[k].tolist() for k in COLUNAS[1:]]
+                for linha in zip(ts, *cols):
+                    f.write("%s,%r,%r,%r,%r,%r,%r,%d\n" % linha)
+                n += len(ts)
+    return n
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not sys.argv[1].endswith((".csv", ".npz")):
+        print("Uso: python exportar_logs.py <saida.csv|saida.npz> [arquivos de log...]")
+        sys.exit(1)
+
+    destino = sys.argv[1]
+    caminhos = sys.argv[2:] or ARQUIVOS_PADRAO
+    if destino.endswith(".npz"):
+        n = exportar_npz(caminhos, destino)
+    else:
+        n = exportar_csv(caminhos, destino)
+    print(f"[Export] {n} registros exportados para {destino}")
@@ -0,0 +1,190 @@
+import os
+import sys
+import math
+import time
+import struct
+import bisect
+import datetime
+from collections import namedtuple
+from escritor_log import EscritorLog, ABRIR_COMPRIMIDO, abrir_segmento
+
+############################
+# Historiador binário indexado
+############################
+# Registros de largura fixa (64 bytes) gravados em segmentos rotativos:
+#
+#   historiador/<origem>-<t0 em ms>.bin
+#
+# O nome de cada segmento guarda o instante do seu primeiro registro, então
+# a lista ordenada de segmentos de uma origem já é o índice de tempo: uma
+# consulta T1..T2 escolhe os segmentos por bisect nos nomes e, dentro de
+# cada um, acha o primeiro registro por busca binária (os registros têm
+# tamanho fixo e estão em ordem de tempo). Cada processo escritor usa a sua
+# própria origem, para que dois processos nunca anexem ao mesmo arquivo.
+# A gravação é feita em lote por uma thread de fundo (escritor_log.py).
+# Com compressao="gzip"/"lzma" os segmentos fechados são comprimidos; a
+# consulta continua escolhendo o segmento pelo nome e só descomprime os que
+# cobrem o intervalo pedido.
+
+HIST_DIR = "historiador"
+SEG_MAX_REGISTROS = 65536   # 4 MiB por segmento
+
+# ts, target xyz, posição xyz, status
+FORMATO = struct.Struct("<d3d3dB7x")
+TAM_REGISTRO = FORMATO.size
+
+STATUS_OK = 0
+STATUS_ERRO = 1
+
+Registro = namedtuple("Registro", "ts tx ty tz px py pz status")
+
+
+def _para_epoch(t):
+    if isinstance(t, datetime.datetime):
+        return t.timestamp()
+    if isinstance(t, str):
+        return datetime.datetime.fromisoformat(t).timestamp()
+    return float(t)
+
+
+def parse_xyz(texto):
+    """Converte "x,y,z" em três floats; devolve None se não for uma posição."""
+    try:
+        x, y, z = map(float, texto.split(","))
+    except (ValueError, AttributeError):
+        return None
+    return x, y, z
+
+
+class HistorianStore(EscritorLog):
+    """Escritor de um fluxo (origem) do historiador binário."""
+
+    def __init__(self, origem, diretorio=HIST_DIR, seg_max=SEG_MAX_REGISTROS, compressao=None, **opcoes):
+        self.origem = origem
+        self.diretorio = diretorio
+        self.seg_max = seg_max
+        self._n = 0
+        os.makedirs(diretorio, exist_ok=True)
+        super().__init__(diretorio, rotacao="nenhuma", compressao=compressao, **opcoes)
+
+    def append(self, target, pos, status=STATUS_OK, ts=None):
+        """Enfileira um registro. pos=None marca erro de comunicação (NaN + STATUS_ERRO)."""
+        if ts is None:
+            ts = time.time()
+        if pos is None:
+            pos = (math.nan, math.nan, math.nan)
+            status = STATUS_ERRO
+        if target is None:
+            target = (math.nan, math.nan, math.nan)
+        return self.escrever((ts, FORMATO.pack(ts, *target, *pos, status)))
+
+    def close(self):
+        self.fechar()
+
+    def _novo_segmento(self, ts):
+        if self._f is not None:
+            anterior = self._f.name
+            self._fechar_arquivo()
+            self._comprimir_em_fundo(anterior)
+        nome = f"{self.origem}-{int(ts * 1000):013d}.bin"
+        self._f = open(os.path.join(self.diretorio, nome), "ab")
+        self._n = self._f.tell() // TAM_REGISTRO
+
+    def _gravar(self, lote):
+        for ts, registro in lote:
+            if self._f is None or self._n >= self.seg_max:
+                self._novo_segmento(ts)
+            self._f.write(registro)
+            self._n += 1
+
+    def _comprimir_pendentes(self):
+        if self.compressao is None:
+            return
+        # todos os segmentos desta origem, menos o último (que pode ser reaberto)
+        segs = _segmentos(self.diretorio).get(self.origem, [])
+        for _, caminho in segs[:-1]:
+            if caminho.endswith(".bin"):
+                self._comprimir_em_fundo(caminho)
+
+
+def _segmentos(diretorio):
+    """{origem: [(t0, caminho), ...]} com os segmentos ordenados por t0."""
+    fluxos = {}
+    try:
+        nomes = os.listdir(diretorio)
+    except FileNotFoundError:
+        return fluxos
+    vistos = {}
+    for nome in nomes:
+        base, ext = os.path.splitext(nome)
+        comprimido = ext in ABRIR_COMPRIMIDO
+        if comprimido:
+            base, ext = os.path.splitext(base)
+        origem, _, t0 = base.rpartition("-")
+        if ext != ".bin" or not origem or not t0.isdigit():
+            continue
+        # durante a compressão existem as duas versões: vale a original
+        if (origem, t0) in vistos and comprimido:
+            continue
+        vistos[(origem, t0)] = os.path.join(diretorio, nome)
+    for (origem, t0), caminho in vistos.items():
+        fluxos.setdefault(origem, []).append((int(t0) / 1000.0, caminho))
+    for segs in fluxos.values():
+        segs.sort()
+    return fluxos
+
+
+def _primeiro_indice(buf, n, t):
+    """Primeiro registro com ts >= t (busca binária no segmento)."""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if struct.unpack_from("<d", buf, mid * TAM_REGISTRO)[0] < t:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _ler_segmento(caminho, t_ini, t_fim):
+    with abrir_segmento(caminho) as buf:
+        n = len(buf) // TAM_REGISTRO
+        if n == 0:
+            return []
+        i = _primeiro_indice(buf, n, t_ini)
+        j = _primeiro_indice(buf, n, t_fim)
+        # o limite superior é inclusivo
+        while j < n and struct.unpack_from("<d", buf, j * TAM_REGISTRO)[0] <= t_fim:
+            j += 1
+        return [Registro(*r) for r in FORMATO.iter_unpack(buf[i * TAM_REGISTRO:j * TAM_REGISTRO])]
+
+
+def query(t_inicio, t_fim, diretorio=HIST_DIR, origens=None):
+    """Registros com t_inicio <= ts <= t_fim, em ordem de tempo.
+
+    t_inicio/t_fim podem ser epoch (s), datetime ou texto ISO.
+    """
+    t_ini, t_fim = _para_epoch(t_inicio), _para_epoch(t_fim)
+    registros = []
+    for origem, segs in _segmentos(diretorio).items():
+        if origens is not None and origem not in origens:
+            continue
+        inicios = [t0 for t0, _ in segs]
+        # último segmento que começa antes de t_ini até o último que começa antes de t_fim
+        a = max(bisect.bisect_right(inicios, t_ini) - 1, 0)
+        b = bisect.bisect_right(inicios, t_fim)
+        for _, caminho in segs[a:b]:
+            registros.extend(_ler_segmento(caminho, t_ini, t_fim))
+    registros.sort(key=lambda r: r.ts)
+    return registros
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python historiador_bin.py <inicio ISO> <fim ISO>")
+        sys.exit(1)
+    for r in query(sys.argv[1], sys.argv[2]):
+        ts = datetime.datetime.fromtimestamp(r.ts).isoformat()
+        estado = "OK" if r.status == STATUS_OK else "ERRO"
+        print(f"[{ts}] Target <{r.tx:.3f},{r.ty:.3f},{r.tz:.3f}> "
+              f"Posicao <{r.px:.4f},{r.py:.4f},{r.pz:.4f}> {estado}")
@@ -0,0 +1,295 @@
+import time
+import socket
+import struct
+import ipaddress
+import threading
+from collections import namedtuple
+import numpy as np
+
+############################
+# Protocolo TCP do CLP
+############################
+# Cada mensagem é uma linha "x,y,z" terminada em '\n'; a resposta do CLP é
+# a posição do drone "x,y,z" (ou "Erro: ...") também terminada em '\n'.
+# No modo frota, "n:x,y,z" endereça o drone n (a partir de 1).
+# Com o enquadramento por linha a mesma conexão pode carregar vários
+# pedidos seguidos. Clientes antigos que mandam "x,y,z" sem '\n' continuam
+# sendo atendidos no modo de uma transação por conexão.
+#
+# Protocolo binário (negociado): o cliente abre a conexão com SAUDACAO e a
+# versão desejada; o CLP responde com SAUDACAO e a versão aceita, e a partir
+# daí os dois lados trocam quadros de tamanho fixo (QUADRO, 40 bytes):
+#
+#   seq (uint32), drone (uint16, a partir de 1), status (uint8),
+#   timestamp (float64, epoch em s), x, y, z (float64)
+#
+# O pedido leva o target e o instante de envio; a resposta repete seq e
+# drone e leva a posição do drone, o instante da leitura no CLP e o status.
+# O seq permite mandar vários pedidos seguidos (pipeline) e casar cada
+# resposta com o seu pedido. SAUDACAO começa com 0xFF, que nunca aparece
+# em texto UTF-8, então o CLP distingue os dois protocolos pelo primeiro
+# byte; um CLP antigo responde à saudação com um erro de texto e o cliente
+# volta ao protocolo de texto.
+
+CLP_HOST = "localhost"
+CLP_PORT = 65432
+TERMINADOR = b"\n"
+TAM_MAX_LINHA = 4096
+
+SAUDACAO = b"\xffCLP"
+VERSAO_BINARIA = 1
+QUADRO = struct.Struct("<IHBxd3d")
+TAM_QUADRO = QUADRO.size
+
+STATUS_OK = 0
+STATUS_FORMATO = 1      # coordenadas não finitas
+STATUS_DRONE = 2        # drone inexistente
+
+MENSAGENS_STATUS = {
+    STATUS_FORMATO: "Erro: Formato invalido.",
+    STATUS_DRONE: "Erro: Drone inexistente.",
+}
+
+RespostaCLP = namedtuple("RespostaCLP", "seq drone status ts x y z")
+
+############################
+# Telemetria UDP do CLP
+############################
+# O CLP publica periodicamente um instantâneo das poses num datagrama UDP
+# (multicast, ou broadcast se o destino não for um grupo multicast), e
+# qualquer número de painéis e registradores o recebe sem passar pelo
+# caminho de comandos TCP. Cada datagrama é:
+#
+#   "CLPT", sessão (uint32), seq (uint32), timestamp (float64, epoch em s),
+#   N (uint16), pos_drone (N x 3 float64), pos_target (N x 3 float64)
+#
+# O seq cresce de um em um; o receptor conta os perdidos e descarta
+# datagramas atrasados ou repetidos. A sessão é sorteada a cada início do
+# CLP: quando ela muda (o CLP reiniciou e o seq voltou a 0), ou quando o
+# fluxo fica parado mais que TELEMETRIA_REINICIO, o receptor recomeça a
+# contagem em vez de tratar o seq novo como atrasado.
+
+TELEMETRIA_GRUPO = "239.255.65.43"
+TELEMETRIA_PORTA = 65433
+MAGICO_TELEMETRIA = b"CLPT"
+CABECALHO_TELEMETRIA = struct.Struct("<4sIIdH")
+TELEMETRIA_REINICIO = 2.0   # sem datagramas por mais que isso, aceita qualquer seq (s)
+
+TelemetriaCLP = namedtuple("TelemetriaCLP", "sessao seq ts pos_drone pos_target")
+
+
+def eh_multicast(endereco):
+    try:
+        return ipaddress.ip_address(endereco).is_multicast
+    except ValueError:
+        return False    # ex.: "<broadcast>"
+
+
+def empacotar_telemetria(sessao, seq, ts, pos_drone, pos_target):
+    """Datagrama de telemetria para as poses (N, 3) de drones e targets."""
+    corpo = np.concatenate((pos_drone, pos_target)).astype("<f8", copy=False).tobytes()
+    return CABECALHO_TELEMETRIA.pack(MAGICO_TELEMETRIA, sessao, seq, ts, len(pos_drone)) + corpo
+
+
+class ReceptorTelemetria:
+    """Assina a telemetria UDP do CLP (grupo multicast ou porta de broadcast)."""
+
+    def __init__(self, grupo=TELEMETRIA_GRUPO, porta=TELEMETRIA_PORTA, interface="0.0.0.0"):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        # vários receptores na mesma máquina
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", porta))
+        if eh_multicast(grupo):
+            mreq = struct.pack("4s4s", socket.inet_aton(grupo), socket.inet_aton(interface))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        self._sock = sock
+        self._sessao = None
+        self._ultimo_seq = None
+        self._ultimo_em = 0.0
+        self.recebidos = 0
+        self.perdidos = 0
+
+    def receber(self, timeout=None):
+        """Próximo instantâneo (TelemetriaCLP) ou None se o timeout esgotar."""
+        self._sock.settimeout(timeout)
+        while True:
+            try:
+                dados = self._sock.recv(65535)
+            except socket.timeout:
+                return None
+            if len(dados) < CABECALHO_TELEMETRIA.size:
+                continue
+            magico, sessao, seq, ts, n = CABECALHO_TELEMETRIA.unpack_from(dados)
+            if magico != MAGICO_TELEMETRIA or len(dados) != CABECALHO_TELEMETRIA.size + 48 * n:
+                continue
+            agora = time.monotonic()
+            if sessao != self._sessao or agora - self._ultimo_em > TELEMETRIA_REINICIO:
+                self._sessao, self._ultimo_seq = sessao, None   # CLP reiniciado
+            if self._ultimo_seq is not None:
+                salto = (seq - self._ultimo_seq) & 0xFFFFFFFF
+                if salto == 0 or salto > 0x7FFFFFFF:
+                    continue    # repetido ou atrasado
+                self.perdidos += salto - 1
+            self._ultimo_seq = seq
+            self._ultimo_em = agora
+            self.recebidos += 1
+            poses = np.frombuffer(dados, "<f8", offset=CABECALHO_TELEMETRIA.size).reshape(2, n, 3)
+            return TelemetriaCLP(sessao, seq, ts, poses[0], poses[1])
+
+    def fechar(self):
+        self._sock.close()
+
+
+class ClienteCLP:
+    """Conexão TCP persistente com o CLP (uma linha por pedido/resposta).
+
+    Com binario=True negocia o protocolo binário ao conectar e passa a usar
+    quadros; se o CLP não o suporta, continua em texto."""
+
+    def __init__(self, host=CLP_HOST, port=CLP_PORT, timeout=1.0, binario=False):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.binario = binario
+        self._sock = None
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def _conectar(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._buffer.clear()
+        if self.binario and not self._negociar():
+            print("[CLP] Protocolo binário não suportado pelo CLP; usando texto.")
+            self.binario = False
+            self.fechar()
+            self._conectar()
+
+    def _negociar(self):
+        self._sock.sendall(SAUDACAO + bytes([VERSAO_BINARIA]))
+        try:
+            resposta = self._ler(len(SAUDACAO) + 1)
+        except (ConnectionError, socket.timeout):
+            return False    # CLP antigo: fechou a conexão ou não respondeu
+        return resposta == SAUDACAO + bytes([VERSAO_BINARIA])
+
+    def _ler(self, n):
+        while len(self._buffer) < n:
+            data = self._sock.recv(4096)
+            if not data:
+                raise ConnectionError("CLP fechou a conexão.")
+            self._buffer += data
+        dados = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return dados
+
+    def fechar(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._buffer.clear()
+
+    def _ler_linha(self):
+        while True:
+            i = self._buffer.find(TERMINADOR)
+            if i >= 0:
+                linha = bytes(self._buffer[:i])
+                del self._buffer[:i + 1]
+                return linha.decode("utf-8").strip()
+            if len(self._buffer) > TAM_MAX_LINHA:
+                raise ConnectionError("Resposta do CLP sem terminador.")
+            data = self._sock.recv(4096)
+            if not data:
+                raise ConnectionError("CLP fechou a conexão.")
+            self._buffer += data
+
+    def _transacao(self, funcao):
+        """Executa funcao() com a conexão aberta; reconecta uma vez se ela caiu."""
+        with self._lock:
+            for tentativa in range(2):
+                try:
+                    if self._sock is None:
+                        self._conectar()
+                    return funcao()
+                except (ConnectionError, socket.timeout, OSError):
+                    self.fechar()
+                    # só repete se a conexão antiga estava morta; uma falha
+                    # ao conectar de novo é propagada para o chamador
+                    if tentativa == 1:
+                        raise
+
+    def _lote(self, pedidos):
+        quadros = bytearray()
+        seqs = []
+        agora = time.time()
+        for drone, (x, y, z) in pedidos:
+            self._seq = (self._seq + 1) & 0xFFFFFFFF
+            seqs.append(self._seq)
+            quadros += QUADRO.pack(self._seq, drone, STATUS_OK, agora, x, y, z)
+        self._sock.sendall(quadros)
+        por_seq = {}
+        while len(por_seq) < len(seqs):
+            r = RespostaCLP._make(QUADRO.unpack(self._ler(TAM_QUADRO)))
+            por_seq[r.seq] = r
+        return [por_seq[s] for s in seqs]
+
+    def _texto(self, msg):
+        self._sock.sendall(msg.encode("utf-8") + TERMINADOR)
+        return self._ler_linha()
+
+    def enviar(self, msg):
+        """Envia um pedido "x,y,z" (ou "n:x,y,z") e devolve a resposta em texto."""
+        def transacao():
+            if not self.binario:
+                return self._texto(msg)
+            drone, sep, coords = msg.rpartition(":")
+            try:
+                x, y, z = map(float, coords.split(","))
+                r = self._lote([(int(drone) if sep else 1, (x, y, z))])[0]
+            except (ValueError, struct.error):
+                return MENSAGENS_STATUS[STATUS_FORMATO]
+            if r.status != STATUS_OK:
+                return MENSAGENS_STATUS.get(r.status, f"Erro: status {r.status}")
+            return f"{r.x!r},{r.y!r},{r.z!r}"
+        return self._transacao(transacao)
+
+    def enviar_xyz(self, xyz, drone=1):
+        """Envia um target e devolve a posição (x, y, z) do drone; erros do CLP
+        viram ValueError. Sem protocolo binário, usa o de texto."""
+        def transacao():
+            if self.binario:
+                return self._lote([(drone, xyz)])[0]
+            prefixo = f"{drone}:" if drone != 1 else ""
+            return self._texto(prefixo + ",".join(map(repr, map(float, xyz))))
+        r = self._transacao(transacao)
+        if isinstance(r, str):
+            if r.startswith("Erro"):
+                raise ValueError(r)
+            x, y, z = map(float, r.split(","))
+            return x, y, z
+        if r.status != STATUS_OK:
+            raise ValueError(MENSAGENS_STATUS.get(r.status, f"Erro: status {r.status}"))
+        return r.x, r.y, r.z
+
+    def enviar_lote(self, pedidos):
+        """Manda vários pedidos (drone, (x, y, z)) de uma vez (pipeline) e
+        devolve as respostas (RespostaCLP) na ordem dos pedidos. Exige o
+        protocolo binário."""
+        def transacao():
+            if not self.binario:
+                raise RuntimeError("Protocolo binário não negociado com o CLP.")
+            return self._lote(pedidos)
+        return self._transacao(transacao)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
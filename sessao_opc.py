@@ -0,0 +1,368 @@
+import os
+import re
+import json
+import time
+import random
+import threading
+from opcua import Client, ua
+
+############################
+# Sessão OPC UA compartilhada (CLP, MES e bridge)
+############################
+# Na primeira conexão as variáveis do drone são procuradas por nome na
+# pasta "Drone" e os NodeIds encontrados são salvos em CACHE_NOS, por URL
+# do servidor. Nas conexões seguintes (e em cada reconexão) os nós são
+# montados direto do cache e validados com um único Read do BrowseName de
+# todos eles: se algum não existir mais ou tiver outro nome (ex.: o
+# servidor foi reconfigurado), a busca por nome é refeita e o cache
+# atualizado. O arquivo é lido uma vez por processo; depois o cache fica em
+# memória (e cada atualização vai para os dois).
+#
+# SessaoOPC cuida da reconexão: ao cair, tenta de novo com backoff
+# exponencial com jitter (RECONEXAO_INICIAL, dobrando até RECONEXAO_MAX),
+# revincula os nós pelos NodeIds já conhecidos e mantém uma thread de
+# keep-alive que lê o estado do servidor a cada KEEPALIVE_PERIODO e sinaliza
+# `caiu` assim que a sessão deixa de responder.
+#
+# Modo frota: em vez de uma pasta "Drone", o servidor tem Drone1..DroneN,
+# cada uma com as mesmas variáveis; vincular_drones() devolve os nós de
+# todos os drones (o cache guarda "DroneK/Variavel" e, em CHAVE_FROTA, a
+# lista de pastas, que só é refeita por Browse quando o cache não vale mais).
+
+OPCUA_URL = "opc.tcp://localhost:53530/OPCUA/SimulationServer"
+CACHE_NOS = "opc_nos.json"
+PASTA_DRONE = "3:Drone"     # caminho padrão no SimulationServer
+OPC_TIMEOUT = 1.0           # timeout de cada requisição e da conexão (s)
+RECONEXAO_INICIAL = 0.05    # primeira espera após uma queda (s)
+RECONEXAO_MAX = 5.0         # maior espera entre tentativas (s)
+KEEPALIVE_PERIODO = 1.0     # s
+
+NOMES_TARGET = ("TargetX", "TargetY", "TargetZ")
+NOMES_DRONE = ("DroneX", "DroneY", "DroneZ")
+PADRAO_FROTA = re.compile(r"^drone(\d+)$")   # pastas Drone1..DroneN (nomes já em minúsculas)
+CHAVE_FROTA = "@frota"      # entrada do cache com as pastas da frota
+
+_lock_cache = threading.Lock()
+_cache_memoria = None   # conteúdo de CACHE_NOS: {url: {nome: NodeId em texto}}
+
+
+def _nomes_de(client, nos):
+    """BrowseName de vários nós num único Read (None se o nó não existe)."""
+    resultados = client.uaclient.get_attributes([n.nodeid for n in nos], ua.AttributeIds.BrowseName)
+    return [r.Value.Value.Name if r.StatusCode.is_good() else None for r in resultados]
+
+
+def _abrir_cache(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _ler_cache(url, caminho=CACHE_NOS):
+    global _cache_memoria
+    with _lock_cache:
+        if _cache_memoria is None:
+            _cache_memoria = _abrir_cache(caminho)
+        return dict(_cache_memoria.get(url, {}))
+
+
+def _salvar_cache(url, entradas, caminho=CACHE_NOS):
+    global _cache_memoria
+    # CLP, MES e bridge compartilham o arquivo: relê e mescla antes de gravar
+    with _lock_cache:
+        cache = _abrir_cache(caminho)
+        cache.setdefault(url, {}).update(entradas)
+        _cache_memoria = cache
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(cache, f, indent=1)
+            os.replace(temporario, caminho)
+        except OSError as e:
+            print(f"[OPC] Não foi possível salvar o cache de nós: {e}")
+
+
+def _filhos_por_nome(client, no):
+    """{nome em minúsculas: nó} dos filhos de `no` (um Browse e um Read)."""
+    filhos = no.get_children()
+    return {nome.lower(): n for n, nome in zip(filhos, _nomes_de(client, filhos)) if nome is not None}
+
+
+def procurar_nos(client, nomes):
+    """Busca por nome (sem diferenciar maiúsculas). "Var" fica na pasta
+    "Drone"; "Pasta/Var" (modo frota) na pasta indicada."""
+    root = client.get_objects_node()
+    objetos = None
+    pastas = {}
+    for nome in nomes:
+        pasta = nome.rpartition("/")[0] or "Drone"
+        if pasta in pastas:
+            continue
+        folder = None
+        if pasta == "Drone":
+            # Tente achar a pasta "Drone" no ns=3 (padrão do SimulationServer),
+            # e tenha fallback para procurar por nome entre os filhos.
+            try:
+                folder = root.get_child([PASTA_DRONE])
+            except Exception:
+                pass
+        if folder is None:
+            if objetos is None:
+                objetos = _filhos_por_nome(client, root)
+            folder = objetos.get(pasta.lower())
+        if folder is None:
+            raise RuntimeError(f"Não encontrei a pasta '{pasta}' no servidor OPC UA.")
+        pastas[pasta] = _filhos_por_nome(client, folder)
+
+    nos = []
+    for nome in nomes:
+        pasta, _, var = nome.rpartition("/")
+        name_to_node = pastas[pasta or "Drone"]
+        if var.lower() not in name_to_node:
+            found = ", ".join(sorted(name_to_node.keys()))
+            raise RuntimeError(
+                "Variáveis esperadas não encontradas. "
+                f"Quero {nome}. "
+                f"Encontradas: {found}"
+            )
+        nos.append(name_to_node[var.lower()])
+    return nos
+
+
+def listar_frota(client):
+    """Pastas Drone1..DroneN do servidor, em ordem numérica."""
+    frota = []
+    for nome in _filhos_por_nome(client, client.get_objects_node()):
+        m = PADRAO_FROTA.match(nome)
+        if m:
+            frota.append((int(m.group(1)), f"Drone{m.group(1)}"))
+    return [nome for _, nome in sorted(frota)]
+
+
+def vincular(client, url, nomes, buscar=True):
+    """Nós das variáveis `nomes`, do cache (um Read de validação) ou por busca.
+
+    Com buscar=False um cache ausente ou desatualizado gera RuntimeError.
+    """
+    cache = _ler_cache(url)
+    if all(n in cache for n in nomes):
+        nos = [client.get_node(cache[n]) for n in nomes]
+        try:
+            encontrados = _nomes_de(client, nos)
+        except ua.UaError:
+            encontrados = None
+        if encontrados is not None and all(
+            e is not None and e.lower() == n.rpartition("/")[2].lower()
+            for e, n in zip(encontrados, nomes)
+        ):
+            return nos
+        if not buscar:
+            raise RuntimeError("Cache de nós desatualizado.")
+        print("[OPC] Cache de nós desatualizado; procurando de novo.")
+    elif not buscar:
+        raise RuntimeError("Nós fora do cache.")
+
+    nos = procurar_nos(client, nomes)
+    _salvar_cache(url, {n: no.nodeid.to_string() for n, no in zip(nomes, nos)})
+    return nos
+
+
+def connect_opc(url=OPCUA_URL, nomes=NOMES_TARGET + NOMES_DRONE, timeout=OPC_TIMEOUT):
+    """Conecta e devolve (client, (nós na ordem de `nomes`))."""
+    client = Client(url, timeout=timeout)
+    client.connect()
+    print("[OPC] Connected")
+    try:
+        nos = vincular(client, url, nomes)
+    except Exception:
+        client.disconnect()
+        raise
+    print("[OPC] Vars bound:", "/".join(nomes))
+    return client, tuple(nos)
+
+
+def vincular_drones(client, url, frota=False):
+    """Variáveis de todos os drones: (pastas, nós Target*, nós Drone*).
+
+    Os nós vêm em listas planas [x1, y1, z1, x2, ...], prontas para ler ou
+    escrever a frota inteira num único pedido. Sem frota há uma só pasta,
+    "Drone"; com frota, as pastas Drone1..DroneN encontradas no servidor. A
+    lista de pastas vem do cache; o Browse só é refeito se ela não valer mais.
+    """
+    if not frota:
+        return _vincular_pastas(client, url, ["Drone"], False)
+    pastas = _ler_cache(url).get(CHAVE_FROTA)
+    if pastas:
+        try:
+            return _vincular_pastas(client, url, pastas, True, buscar=False)
+        except (RuntimeError, ua.UaError):
+            print("[OPC] Frota do cache desatualizada; listando as pastas de novo.")
+    pastas = listar_frota(client)
+    if not pastas:
+        raise RuntimeError("Nenhuma pasta Drone1..DroneN no servidor OPC UA.")
+    resultado = _vincular_pastas(client, url, pastas, True)
+    _salvar_cache(url, {CHAVE_FROTA: pastas})
+    return resultado
+
+
+def _vincular_pastas(client, url, pastas, frota, buscar=True):
+    prefixo = (lambda p: f"{p}/") if frota else (lambda p: "")
+    alvos = [prefixo(p) + n for p in pastas for n in NOMES_TARGET]
+    drones = [prefixo(p) + n for p in pastas for n in NOMES_DRONE]
+    nos = vincular(client, url, alvos + drones, buscar)
+    return pastas, nos[:len(alvos)], nos[len(alvos):]
+
+
+def desconectar(client):
+    """Encerra a sessão sem propagar erros (o servidor pode já ter caído)."""
+    if client is None:
+        return
+    try:
+        client.disconnect()
+    except Exception:
+        try:
+            client.disconnect_socket()
+        except Exception:
+            pass
+
+
+class Backoff:
+    """Espera exponencial com jitter e métricas de quedas/tempo fora do ar."""
+
+    def __init__(self, tag="OPC", inicial=RECONEXAO_INICIAL, maximo=RECONEXAO_MAX):
+        self.tag = tag
+        self.inicial = inicial
+        self.maximo = maximo
+        self.tentativas = 0
+        self.quedas = 0
+        self.reconexoes = 0
+        self.tempo_fora = 0.0
+        self.maior_queda = 0.0
+        self._caiu_em = None
+        self._proxima = 0.0     # instante liberado para a próxima tentativa
+
+    @property
+    def fora(self):
+        return self._caiu_em is not None
+
+    def falhou(self, erro):
+        """Registra a falha (abre uma queda se ainda não havia) e agenda a
+        próxima tentativa: metade fixa e metade aleatória do passo atual. A
+        espera em si fica para esperar()."""
+        if self._caiu_em is None:
+            self._caiu_em = time.monotonic()
+            self.quedas += 1
+        passo = min(self.maximo, self.inicial * 2 ** self.tentativas)
+        espera = passo * random.uniform(0.5, 1.0)
+        self.tentativas += 1
+        print(f"[{self.tag}] Erro: {str(erro) or type(erro).__name__}. Nova tentativa em {1e3 * espera:.0f} ms "
+              f"(tentativa {self.tentativas}).")
+        self._proxima = time.monotonic() + espera
+
+    def esperar(self):
+        """Dorme o que falta da espera agendada pela última falha."""
+        restante = self._proxima - time.monotonic()
+        if restante > 0:
+            time.sleep(restante)
+
+    def conectou(self):
+        if self._caiu_em is not None:
+            duracao = time.monotonic() - self._caiu_em
+            self.tempo_fora += duracao
+            self.maior_queda = max(self.maior_queda, duracao)
+            self.reconexoes += 1
+            print(f"[{self.tag}] Reconectado após {duracao:.3f} s "
+                  f"(quedas: {self.quedas}, fora do ar no total: {self.tempo_fora:.3f} s).")
+        self._caiu_em = None
+        self.tentativas = 0
+
+    def estatisticas(self):
+        fora_agora = time.monotonic() - self._caiu_em if self._caiu_em is not None else 0.0
+        return {
+            "quedas": self.quedas,
+            "reconexoes": self.reconexoes,
+            "tempo_fora": self.tempo_fora + fora_agora,
+            "maior_queda": max(self.maior_queda, fora_agora),
+            "fora_agora": fora_agora,
+        }
+
+
+class SessaoOPC:
+    """Conexão OPC UA que se refaz sozinha: conectar() só retorna conectado.
+
+    Uso:
+        sessao = SessaoOPC(url, nomes)
+        while True:
+            client, nos = sessao.conectar()
+            try:
+                ...  # trabalho; checar sessao.caiu nas esperas longas
+            except Exception as e:
+                sessao.falhou(e)
+
+    `ligar(client)` substitui a busca por nomes quando os nós não são as
+    variáveis da pasta "Drone" (ex.: cliente do chained server do MES).
+    """
+
+    def __init__(self, url=OPCUA_URL, nomes=NOMES_TARGET + NOMES_DRONE, tag="OPC",
+                 ligar=None, keepalive=KEEPALIVE_PERIODO, timeout=OPC_TIMEOUT):
+        self.url = url
+        self.nomes = nomes
+        self.ligar = ligar
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.backoff = Backoff(tag)
+        self.client = None
+        self.nos = None
+        self.caiu = threading.Event()
+
+    def conectar(self):
+        while True:
+            self.backoff.esperar()
+            try:
+                if self.ligar is None:
+                    client, nos = connect_opc(self.url, self.nomes, self.timeout)
+                else:
+                    client = Client(self.url, timeout=self.timeout)
+                    client.connect()
+                    try:
+                        nos = self.ligar(client)
+                    except Exception:
+                        desconectar(client)
+                        raise
+            except Exception as e:
+                self.backoff.falhou(e)
+                continue
+            self.client, self.nos = client, nos
+            self.caiu.clear()
+            self.backoff.conectou()
+            if self.keepalive:
+                threading.Thread(target=self._vigiar, args=(client,), daemon=True).start()
+            return client, nos
+
+    def falhou(self, erro):
+        """Descarta a sessão atual sem bloquear; a espera do backoff acontece
+        no próximo conectar()."""
+        client, self.client = self.client, None
+        self.caiu.set()
+        desconectar(client)
+        self.backoff.falhou(erro)
+
+    def fechar(self):
+        client, self.client = self.client, None
+        desconectar(client)
+
+    def estatisticas(self):
+        return self.backoff.estatisticas()
+
+    def _vigiar(self, client):
+        estado = client.get_node(ua.ObjectIds.Server_ServerStatus_State)
+        while self.client is client and not self.caiu.wait(self.keepalive):
+            try:
+                estado.get_value()
+            except Exception as e:
+                if self.client is client:
+                    print(f"[{self.backoff.tag}] Keep-alive sem resposta: {str(e) or type(e).__name__}")
+                    self.caiu.set()
+                return
@@ -0,0 +1,310 @@
+import sys
+import time
+import threading
+import zmq
+import cbor2
+import numpy as np
+
+############################
+# CoppeliaSim sem interface (ZMQ Remote API)
+############################
+# Servidor REP que fala o protocolo do RemoteAPIClient: cada requisição é
+# um mapa CBOR {"func": "sim.<nome>", "args": [...]} e a resposta é
+# {"ret": [...]} ou {"err": "..."}. Só as chamadas que brigde.py usa são
+# implementadas; o script auxiliar do modo "helper" (bridge_tick) é
+# emulado em Python.
+#
+# A cena tem N pares drone/target, "/Quadcopter[i]/base" e "/target[i]"
+# (i = 0..N-1; o primeiro também como "/Quadcopter/base" e "/target"). As
+# posições ficam num único array (2N, 3) e cada drone segue o seu target
+# por um modelo de primeira ordem com constante de tempo TAU:
+#
+#   p_drone += (1 - exp(-dt / TAU)) * (p_target - p_drone)
+#
+# calculado para todos os drones numa operação. A integração é preguiçosa:
+# a cada requisição a cena avança o tempo real decorrido desde a anterior
+# (exata, pois o target fica constante entre requisições); com
+# setStepping(True) o tempo só avança SIM_DT a cada sim.step(). Assim a
+# ponte pode rodar a centenas de Hz sem o custo de uma interface gráfica, e
+# o custo do próprio simulador (física e atendimento) é medido à parte em
+# perfil().
+#
+# O modo trajetória da ponte também é emulado: bridge_traj guarda as
+# amostras (K, N, 3) e a cena as reproduz no próprio tempo de simulação,
+# integrando em subpassos de no máximo um intervalo entre amostras;
+# bridge_poses devolve as poses dos drones e targets.
+#
+# Uso: python sim_headless.py [porta] [n_drones]
+
+SIM_HOST = "127.0.0.1"
+SIM_PORT = 23000
+DRONE_PATH = "/Quadcopter/base"
+TARGET_PATH = "/target"
+TAU = 0.15                  # constante de tempo do drone (s)
+SIM_DT = 0.05               # passo de simulação no modo síncrono (s)
+PERFIL_PERIODO = 5.0        # intervalo entre relatórios da linha de comando (s)
+
+# constantes com os mesmos valores do CoppeliaSim
+SIMULATION_STOPPED = 0
+SIMULATION_RUNNING = 17     # sim.simulation_advancing_running
+SCRIPTTYPE_CUSTOMIZATION = 6
+
+CONSTANTES = {
+    "simulation_stopped": SIMULATION_STOPPED,
+    "simulation_advancing_running": SIMULATION_RUNNING,
+    "scripttype_customization": SCRIPTTYPE_CUSTOMIZATION,
+    "scripttype_customizationscript": SCRIPTTYPE_CUSTOMIZATION,
+}
+
+FUNCOES = (
+    "getSimulationState", "getSimulationTime", "startSimulation", "stopSimulation", "setStepping", "step",
+    "getObject", "getObjectPosition", "setObjectPosition",
+    "createScript", "removeScript", "removeObjects", "callScriptFunction",
+)
+
+
+def caminhos_par(i):
+    """Caminhos do i-ésimo drone e do seu target na cena."""
+    return f"/Quadcopter[{i}]/base", f"/target[{i}]"
+
+
+class SimHeadless:
+    """Cena com N drones que seguem seus targets, servida pela ZMQ Remote API."""
+
+    def __init__(self, host=SIM_HOST, port=SIM_PORT, n_drones=1, tau=TAU, sim_dt=SIM_DT):
+        self.endereco = f"tcp://{host}:{port}"
+        self.tau = tau
+        self.sim_dt = sim_dt
+        # handles: drones em 0..N-1, targets em N..2N-1
+        self.handles = {DRONE_PATH: 0, TARGET_PATH: n_drones}
+        for i in range(n_drones):
+            drone, target = caminhos_par(i)
+            self.handles[drone] = i
+            self.handles[target] = n_drones + i
+        self.drones = np.arange(n_drones)
+        self.alvos = np.arange(n_drones, 2 * n_drones)
+        self.pos = np.zeros((2 * n_drones, 3))
+        self.estado = SIMULATION_STOPPED
+        self.tempo = 0.0            # tempo de simulação (s)
+        self.traj = None            # (alvos, dt, amostras (K, N, 3), t0)
+        self.stepping = False
+        self.scripts = set()
+        self.ticks = 0              # ticks da ponte por drone (escrita de target ou leitura de pose)
+        self._t = time.monotonic()
+        self._proximo_handle = 2 * n_drones + 100
+        self._lock = threading.RLock()
+        self._parar = threading.Event()
+        self._thread = None
+        self.zerar_perfil()
+
+    # --- modelo ---
+
+    def _integrar(self, dt):
+        t0 = time.perf_counter()
+        while dt > 1e-12:
+            # com uma trajetória em andamento o target muda entre amostras
+            h = dt if self.traj is None else min(dt, self.traj[1])
+            self.tempo += h
+            dt -= h
+            if self.traj is not None:
+                self._reproduzir()
+            a = -np.expm1(-h / self.tau)
+            self.pos[self.drones] += a * (self.pos[self.alvos] - self.pos[self.drones])
+        self.t_fisica += time.perf_counter() - t0
+        self.passos += 1
+
+    def _reproduzir(self):
+        alvos, dt, amostras, t0 = self.traj
+        t = self.tempo - t0
+        s = t / dt
+        k = min(int(s), len(amostras) - 1)
+        k1 = min(k + 1, len(amostras) - 1)
+        self.pos[alvos] = amostras[k] + min(s - k, 1.0) * (amostras[k1] - amostras[k])
+        if t >= (len(amostras) - 1) * dt:
+            self.traj = None
+
+    def _avancar(self):
+        agora = time.monotonic()
+        dt, self._t = agora - self._t, agora
+        if self.estado == SIMULATION_RUNNING and not self.stepping and dt > 0:
+            self._integrar(dt)
+
+    # --- acesso local (benchmark e testes) ---
+
+    def posicao(self, caminho):
+        with self._lock:
+            self._avancar()
+            return self.pos[self.handles[caminho]].tolist()
+
+    def colocar(self, caminho, p):
+        with self._lock:
+            self._avancar()
+            self.pos[self.handles[caminho]] = p
+
+    def zerar_perfil(self):
+        self.requisicoes = 0
+        self.passos = 0
+        self.t_fisica = 0.0
+        self.t_atendimento = 0.0
+        self.por_funcao = {}
+
+    def perfil(self):
+        """Custo do simulador: física e atendimento das requisições (s)."""
+        return {
+            "requisicoes": self.requisicoes,
+            "passos": self.passos,
+            "t_fisica": self.t_fisica,
+            "t_atendimento": self.t_atendimento,
+            "por_funcao": dict(self.por_funcao),
+        }
+
+    # --- API sim.* (mesmos nomes e argumentos do CoppeliaSim) ---
+
+    def getSimulationState(self):
+        return self.estado
+
+    def getSimulationTime(self):
+        return self.tempo
+
+    def startSimulation(self):
+        self.estado = SIMULATION_RUNNING
+        return 1
+
+    def stopSimulation(self):
+        self.estado = SIMULATION_STOPPED
+        return 1
+
+    def setStepping(self, enable=True):
+        anterior, self.stepping = self.stepping, bool(enable)
+        return int(anterior)
+
+    def step(self, wait=True):
+        if self.estado == SIMULATION_RUNNING and self.stepping:
+            self._integrar(self.sim_dt)
+        return None
+
+    def getObject(self, caminho, opcoes=None):
+        if caminho not in self.handles:
+            raise KeyError(f"object does not exist: {caminho}")
+        return self.handles[caminho]
+
+    def getObjectPosition(self, handle, relativo=-1):
+        return self.pos[handle].tolist()
+
+    def setObjectPosition(self, handle, relativo, p):
+        self.pos[handle] = p
+        if handle >= len(self.drones):
+            self.ticks += 1
+        return None
+
+    def createScript(self, tipo, codigo, *opcoes):
+        if "bridge_tick" not in codigo:
+            raise ValueError("só o script auxiliar da ponte é emulado")
+        self._proximo_handle += 1
+        self.scripts.add(self._proximo_handle)
+        return self._proximo_handle
+
+    def removeScript(self, handle):
+        self.scripts.discard(handle)
+        return None
+
+    def removeObjects(self, handles):
+        for h in handles:
+            self.scripts.discard(h)
+        return None
+
+    def callScriptFunction(self, funcao, script, *args):
+        if script not in self.scripts:
+            raise KeyError(f"script desconhecido: {script}")
+        if funcao == "bridge_tick":
+            targets, drones, ps = args
+            self.pos[targets] = np.reshape(ps, (-1, 3))
+            self.ticks += len(targets)
+            return self.pos[drones].ravel().tolist()
+        if funcao == "bridge_traj":
+            targets, dt, n, ps = args
+            self.traj = (np.asarray(targets), dt, np.reshape(ps, (n, len(targets), 3)), self.tempo)
+            self._reproduzir()
+            return n
+        if funcao == "bridge_poses":
+            targets, drones = args
+            self.ticks += len(drones)
+            t = self.tempo - self.traj[3] if self.traj is not None else -1
+            return self.pos[drones].ravel().tolist() + self.pos[targets].ravel().tolist() + [t]
+        raise KeyError(f"função de script desconhecida: {funcao}")
+
+    # --- servidor ZMQ ---
+
+    def info(self):
+        descricao = {nome: {"func": f"sim.{nome}"} for nome in FUNCOES}
+        descricao.update({nome: {"const": v} for nome, v in CONSTANTES.items()})
+        return descricao
+
+    def atender(self, req):
+        func = req.get("func", "")
+        args = req.get("args") or []
+        t0 = time.perf_counter()
+        try:
+            if func == "zmqRemoteApi.info":
+                ret = self.info()
+            elif func == "zmqRemoteApi.require":
+                ret = None
+            elif func.startswith("sim.") and func[4:] in FUNCOES:
+                with self._lock:
+                    self._avancar()
+                    ret = getattr(self, func[4:])(*args)
+            else:
+                raise KeyError(f"função não suportada: {func}")
+            resposta = {"ret": [] if ret is None else [ret]}
+        except Exception as e:
+            resposta = {"err": str(e)}
+        dt = time.perf_counter() - t0
+        self.requisicoes += 1
+        self.t_atendimento += dt
+        n, total = self.por_funcao.get(func, (0, 0.0))
+        self.por_funcao[func] = (n + 1, total + dt)
+        return resposta
+
+    def _servir(self):
+        ctx = zmq.Context.instance()
+        sock = ctx.socket(zmq.REP)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.bind(self.endereco)
+        try:
+            while not self._parar.is_set():
+                if not sock.poll(100):
+                    continue
+                resposta = self.atender(cbor2.loads(sock.recv()))
+                sock.send(cbor2.dumps(resposta))
+        finally:
+            sock.close()
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._servir, name="sim-headless", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else SIM_PORT
+    n_drones = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    sim = SimHeadless(port=porta, n_drones=n_drones).iniciar()
+    print(f"[SIM] CoppeliaSim sem interface em {sim.endereco} ({n_drones} drone(s)). Ctrl+C para sair.")
+    try:
+        while True:
+            time.sleep(PERFIL_PERIODO)
+            p = sim.perfil()
+            sim.zerar_perfil()
+            if not p["requisicoes"]:
+                continue
+            print(f"[SIM] {p['requisicoes'] / PERFIL_PERIODO:.0f} req/s | "
+                  f"atendimento {1e6 * p['t_atendimento'] / p['requisicoes']:.1f} us/req | "
+                  f"física {1e6 * p['t_fisica'] / max(p['passos'], 1):.1f} us/passo "
+                  f"({p['passos']} passos)")
+    except KeyboardInterrupt:
+        sim.parar()
@@ -0,0 +1,30 @@
+import importlib
+import time
+import pytest
+
+
+@pytest.fixture
+def ihm(tmp_path, monkeypatch):
+    # o IHM cria o historiador no diretório atual ao ser importado
+    monkeypatch.chdir(tmp_path)
+    modulo = importlib.import_module("IHM")
+    monkeypatch.setattr(modulo, "STREAM_KEEPALIVE", 0.2)
+    monkeypatch.setattr(modulo.poller, "start", lambda: None)
+    return modulo
+
+
+def test_wait_update_sem_amostra_espera_o_timeout(ihm):
+    poller = ihm.TelemetryPoller()
+    t0 = time.monotonic()
+    assert poller.wait_update(-1, 0.2) == (None, -1)
+    assert time.monotonic() - t0 >= 0.19
+
+
+def test_stream_sem_clp_so_manda_keep_alive_no_intervalo(ihm):
+    with ihm.app.server.test_request_context("/telemetria/stream"):
+        resposta = ihm.telemetry_stream()
+    eventos = resposta.response
+    t0 = time.monotonic()
+    pedacos = [next(eventos) for _ in range(2)]
+    assert pedacos == [": keep-alive\n\n"] * 2
+    assert time.monotonic() - t0 >= 0.39
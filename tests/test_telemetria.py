@@ -0,0 +1,37 @@
+import socket
+import numpy as np
+from protocolo_clp import ReceptorTelemetria, empacotar_telemetria
+
+PORTA = 48970
+POSES = np.array([[1.0, 2.0, 3.0]])
+
+
+def _enviar(sessao, seq):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.sendto(empacotar_telemetria(sessao, seq, 0.0, POSES, POSES), ("127.0.0.1", PORTA))
+
+
+def test_reinicio_do_clp_aceita_seq_menor():
+    receptor = ReceptorTelemetria("127.0.0.1", PORTA)
+    try:
+        _enviar(7, 1000)
+        assert receptor.receber(timeout=1.0).seq == 1000
+        _enviar(8, 0)       # CLP reiniciado: sessão nova, seq de volta a 0
+        amostra = receptor.receber(timeout=1.0)
+        assert amostra is not None and (amostra.sessao, amostra.seq) == (8, 0)
+        assert amostra.pos_drone.tolist() == POSES.tolist()
+    finally:
+        receptor.fechar()
+
+
+def test_mesma_sessao_descarta_atrasado():
+    receptor = ReceptorTelemetria("127.0.0.1", PORTA)
+    try:
+        _enviar(7, 1000)
+        _enviar(7, 999)
+        _enviar(7, 1002)
+        assert receptor.receber(timeout=1.0).seq == 1000
+        assert receptor.receber(timeout=1.0).seq == 1002
+        assert receptor.perdidos == 1
+    finally:
+        receptor.fechar()